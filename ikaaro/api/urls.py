@@ -23,7 +23,9 @@ from views import Api_LoginView
 from views import ApiDevPanel_ResourceJSON, ApiDevPanel_ResourceRaw, ApiDevPanel_ResourceHistory
 from views import ApiDevPanel_ClassidViewDetails, ApiDevPanel_ClassidViewList
 from views import ApiDevPanel_Config, ApiDevPanel_Log
-from views import ApiDevPanel_CatalogReindex, UUIDView
+from views import ApiDevPanel_CatalogReindex, ApiDevPanel_CatalogSearch
+from views import ApiDevPanel_CatalogTextQueue
+from views import UUIDView
 from views import ApiDevPanel_ServerView, ApiDevPanel_ServerStop
 
 
@@ -45,6 +47,8 @@ urlpatterns = [
     urlpattern('/devpanel/log/update', ApiDevPanel_Log(source_name='update')),
     # Catalog
     urlpattern('/devpanel/catalog/reindex', ApiDevPanel_CatalogReindex),
+    urlpattern('/devpanel/catalog/search', ApiDevPanel_CatalogSearch),
+    urlpattern('/devpanel/catalog/text-queue', ApiDevPanel_CatalogTextQueue),
     # Server
     urlpattern('/devpanel/server', ApiDevPanel_ServerView),
     urlpattern('/devpanel/server/stop', ApiDevPanel_ServerStop),
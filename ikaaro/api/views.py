@@ -27,7 +27,8 @@ from itools.web.views import ItoolsView
 from ikaaro.fields import Boolean_Field, Char_Field, Integer_Field
 from ikaaro.fields import Email_Field, Password_Field, Datetime_Field
 from ikaaro.server import get_config
-from ikaaro.utils import get_resource_by_uuid_query
+from ikaaro.utils import get_estimated_total, get_keyset_page
+from ikaaro.utils import get_reindex_query, get_resource_by_uuid_query
 
 
 class Api_DocView(STLView):
@@ -297,19 +298,101 @@ class ApiDevPanel_Log(Api_View):
 
 
 class ApiDevPanel_CatalogReindex(Api_View):
-    """ Reindex the catalog
+    """ Reindex the catalog, or only the resources of a class, within a path
+    or modified within a period
     """
 
     access = 'is_admin'
     known_methods = ['POST']
+    schema = {
+        'class_id': Char_Field(title=MSG(u'Class id (or base class id)')),
+        'abspath': Char_Field(title=MSG(u'Absolute path of the subtree')),
+        'mtime_from': Datetime_Field(title=MSG(u'Modified since')),
+        'mtime_to': Datetime_Field(title=MSG(u'Modified before'))}
+    response_schema = {
+        'n': Integer_Field(title=MSG(u'Number of resources reindexed'))
+    }
 
     def POST(self, root, context):
-        n = context.database.reindex_catalog(base_abspath='/')
+        form = context.form
+        query = get_reindex_query(
+            class_id=form['class_id'],
+            base_abspath=form['abspath'],
+            mtime_from=form['mtime_from'],
+            mtime_to=form['mtime_to'])
+        n = context.database.reindex_resources(query)
         kw = {'n': n}
         return self.return_json(kw, context)
 
 
 
+class ApiDevPanel_CatalogSearch(Api_View):
+    """ Browse the resources of a class, or within a path, sorted by abspath.
+    The pages are given by the cursor returned as 'next' (or 'previous')
+    """
+
+    access = 'is_admin'
+    known_methods = ['GET']
+    query_schema = {
+        'class_id': Char_Field(title=MSG(u'Class id (or base class id)')),
+        'abspath': Char_Field(title=MSG(u'Absolute path of the subtree')),
+        'reverse': Boolean_Field(title=MSG(u'Reverse order')),
+        'size': Integer_Field(title=MSG(u'Size of the page'), default=50),
+        'cursor': Char_Field(title=MSG(u'Cursor of the page')),
+        'estimate': Boolean_Field(title=MSG(u'Estimate the total'))}
+    response_schema = {
+        'items': Char_Field(title=MSG(u'Resources (abspath, format, title)')),
+        'total': Integer_Field(title=MSG(u'Number of resources found')),
+        'previous': Char_Field(title=MSG(u'Cursor of the previous page')),
+        'next': Char_Field(title=MSG(u'Cursor of the next page'))
+    }
+
+    def GET(self, root, context):
+        query = context.query
+        search_query = get_reindex_query(
+            class_id=query['class_id'],
+            base_abspath=query['abspath'])
+        results = context.search(search_query)
+        documents, previous, next = get_keyset_page(
+            results, 'abspath', query['reverse'], query['size'],
+            query['cursor'])
+        items = [ {'abspath': x.abspath, 'format': x.format, 'title': x.title}
+                  for x in documents ]
+        if query['estimate']:
+            total = get_estimated_total(results)
+        else:
+            total = len(results)
+        kw = {'items': items,
+              'total': total,
+              'previous': previous,
+              'next': next}
+        return self.return_json(kw, context)
+
+
+
+class ApiDevPanel_CatalogTextQueue(Api_View):
+    """ Return the state of the deferred full-text indexation queue
+    """
+
+    access = 'is_admin'
+    known_methods = ['GET']
+    response_schema = {
+        'enabled': Boolean_Field(title=MSG(u'Deferred full-text indexation')),
+        'depth': Integer_Field(title=MSG(u'Number of resources queued')),
+        'lag': Integer_Field(title=MSG(u'Age of the oldest entry (seconds)'))
+    }
+
+    def GET(self, root, context):
+        text_queue = context.server.text_queue
+        if text_queue is None:
+            kw = {'enabled': False, 'depth': 0, 'lag': 0}
+        else:
+            kw = text_queue.get_status()
+            kw['enabled'] = True
+        return self.return_json(kw, context)
+
+
+
 class ApiDevPanel_ServerView(Api_View):
     """ Return informations about server timestamp / pid / port
     """
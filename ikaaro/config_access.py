@@ -31,6 +31,8 @@ from autoedit import AutoEdit
 from buttons import Remove_BrowseButton
 from config import Configuration
 from config_common import NewResource_Local
+from database import get_context_cache, get_context_value
+from database import register_commit_cache
 from enumerates import Groups_Datatype
 from fields import Select_Field
 from folder import Folder
@@ -38,6 +40,11 @@ from resource_ import DBResource
 from utils import get_base_path_query
 
 
+# The compiled access rules {(user groups, permission, class_id): query}
+rules_queries = {}
+register_commit_cache(rules_queries, '/config/access', '/config/groups')
+
+
 ###########################################################################
 # Fields & datatypes
 ###########################################################################
@@ -249,12 +256,23 @@ class ConfigAccess_Browse(Folder_BrowseContent):
         return key
 
 
-    def get_key_sorted_by_group(self):
-        def key(item, cache={}):
-            title = Groups_Datatype.get_value(item.group)
+    def get_group_title(self, context, group):
+        """Returns the title of the group, looked up once per request for the
+        sort key and the table column.
+        """
+        def get_group_title(group):
+            title = Groups_Datatype.get_value(group)
             if isinstance(title, MSG):
                 title = title.gettext()
-            return title.lower()
+            return title
+        return get_context_value(context.database, 'group_titles', group,
+                                 get_group_title)
+
+
+    def get_key_sorted_by_group(self):
+        context = self.context
+        def key(item):
+            return self.get_group_title(context, item.group).lower()
         return key
 
 
@@ -272,15 +290,15 @@ class ConfigAccess_Browse(Folder_BrowseContent):
 
             return title, path
 
-        proxy = super(ConfigAccess_Browse, self)
-        value = proxy.get_item_value(resource, context, item, column)
-
-        if column == 'group':
+        elif column == 'group':
             group = item.get_value('group')
+            value = self.get_group_title(context, group)
             if group[0] == '/':
                 return value, group
+            return value
 
-        return value
+        proxy = super(ConfigAccess_Browse, self)
+        return proxy.get_item_value(resource, context, item, column)
 
 
 
@@ -339,20 +357,7 @@ class ConfigAccess(Folder):
             return AllQuery()
 
         # 1. Back-office access rules
-        rules_query = OrQuery()
-        for rule in self.get_resources():
-            if rule.get_value('permission') != permission:
-                continue
-
-            if rule.get_value('group') not in user_groups:
-                continue
-
-            if permission == 'add':
-                r_format = rule.get_value('search_format')
-                if class_id and r_format and class_id != r_format:
-                    continue
-
-            rules_query.append(rule.get_search_query())
+        rules_query = self.get_rules_query(user_groups, permission, class_id)
 
         # Case: anonymous
         if not user:
@@ -370,15 +375,79 @@ class ConfigAccess(Folder):
         return query
 
 
+    def get_rules_query(self, user_groups, permission, class_id=None):
+        """Returns the query of the access rules that apply to the given
+        user groups.  It is cached until the rules or the groups change.
+        """
+        if permission != 'add':
+            # The class id is only used by the 'add' rules
+            class_id = None
+        key = (frozenset(user_groups), permission, class_id)
+        rules_query = rules_queries.get(key)
+        if rules_query is not None:
+            return rules_query
+
+        rules_query = OrQuery()
+        for rule in self.get_resources():
+            if rule.get_value('permission') != permission:
+                continue
+
+            if rule.get_value('group') not in user_groups:
+                continue
+
+            if permission == 'add':
+                r_format = rule.get_value('search_format')
+                if class_id and r_format and class_id != r_format:
+                    continue
+
+            rules_query.append(rule.get_search_query())
+
+        # Do not cache the rules being changed
+        if not getattr(self.database, 'has_changed', False):
+            rules_queries[key] = rules_query
+        return rules_query
+
+
     def has_permission(self, user, permission, resource, class_id=None):
-        # The query
-        query = AndQuery(
-            self.get_search_query(user, permission, class_id),
-            PhraseQuery('abspath', str(resource.abspath)))
-
-        # Search
-        results = get_context().search(query, user=user)
-        return len(results) > 0
+        resources = self.filter_allowed(user, permission, [resource],
+                                        class_id)
+        return len(resources) > 0
+
+
+    def filter_allowed(self, user, permission, resources, class_id=None):
+        """Returns the resources, of the given list, for which the user has
+        the permission.  The permissions not already checked in this request
+        are checked with a single search.
+        """
+        # The permissions checked by this request {key: bool}
+        cache = get_context_cache(self.database, 'permissions')
+        if cache is None:
+            cache = {}
+        userpath = str(user.abspath) if user else None
+        keys = [ (userpath, permission, str(x.abspath), class_id)
+                 for x in resources ]
+
+        # Check the permissions not in the cache
+        abspaths = set([ key[2] for key in keys if key not in cache ])
+        if abspaths:
+            allowed = set()
+            search_query = self.get_search_query(user, permission, class_id)
+            abspaths = sorted(abspaths)
+            context = get_context()
+            for i in range(0, len(abspaths), 200):
+                query = AndQuery(
+                    search_query,
+                    OrQuery(*[ PhraseQuery('abspath', x)
+                               for x in abspaths[i:i+200] ]))
+                results = context.search(query, user=user)
+                for brain in results.get_documents():
+                    allowed.add(brain.abspath)
+            for abspath in abspaths:
+                key = (userpath, permission, abspath, class_id)
+                cache[key] = abspath in allowed
+
+        # Ok
+        return [ x for x, key in zip(resources, keys) if cache[key] ]
 
 
     def get_document_types(self):
@@ -28,6 +28,7 @@ from autoadd import AutoAdd
 from autoedit import AutoEdit
 from config import Configuration
 from config_common import NewResource_Local
+from database import register_commit_cache
 from buttons import Remove_BrowseButton
 from fields import Select_Field, URI_Field
 from order import OrderedFolder, OrderedFolder_BrowseContent
@@ -35,6 +36,13 @@ from utils import split_reference
 from widgets import PathSelectorWidget
 
 
+# The menu trees {(menu, user, user groups, language, first child): items},
+# cleared on every change as the access to the targets may change
+menu_trees = {}
+menu_trees_size = 1000
+register_commit_cache(menu_trees)
+
+
 
 class Target_Field(Select_Field):
 
@@ -133,14 +141,108 @@ class MenuItem(OrderedFolder):
 
 
     def get_menu_namespace_level(self, context, url, use_first_child=False):
-        menu_abspath = self.abspath
         here = context.resource
         here_abspath = here.abspath
-        here_view_name = url[-1]
-        here_abspath_and_view = '%s/%s' % (here_abspath, here_view_name)
+        here_abspath_and_view = '%s/%s' % (here_abspath, url[-1])
+        tree = self.get_menu_tree(context, use_first_child)
+        return self._get_menu_items(tree, here_abspath, here_abspath_and_view)
+
+
+    def _get_menu_items(self, tree, here_abspath, here_abspath_and_view):
+        """Returns a copy of the items of the menu tree, with the values that
+        depend on the current page: 'active', 'in_path' and 'class'.
+        """
         items = []
+        for node in tree:
+            item = dict(node)
+            del item['abspath_and_view'], item['original_abspath']
+            item['items'] = self._get_menu_items(node['items'], here_abspath,
+                                                 here_abspath_and_view)
+            # Set active, in_path
+            active = in_path = False
+            if node['abspath_and_view'] is None:
+                # External link
+                pass
+            elif here_abspath_and_view == node['abspath_and_view']:
+                active = True
+            else:
+                # Use the original path for the highlight
+                res_abspath = node['original_abspath']
+                common_prefix = here_abspath.get_prefix(res_abspath)
+                # Avoid to always set the root entree 'in_path'
+                # If common prefix equals root abspath set in_path to False
+                # otherwise compare common_prefix and res_abspath
+                if common_prefix != Path('/'):
+                    in_path = (common_prefix == res_abspath)
+            item['in_path'] = active or in_path
+            item['active'] = active
+            items.append(item)
+
+        # Set class
+        x = None
+        for i, item in enumerate(items):
+            if item['active']:
+                x = i
+                break
+            if item['in_path'] and x is None:
+                x = i
+                break
+        if x is not None:
+            items[x]['class'] = 'in-path'
 
-        for resource in self.get_resources_in_order():
+        if len(items) > 0:
+            # Add class "first" to the first item
+            css = items[0]['class'] or ''
+            items[0]['class'] = css + ' first'
+            # Add class "last" to the last item
+            css = items[-1]['class'] or ''
+            items[-1]['class'] = css + ' last'
+
+        return items
+
+
+    def get_menu_tree(self, context, use_first_child=False):
+        """Returns the items of the menu the user is allowed to access, with
+        their sub-items, but without the values that depend on the current
+        page.  It is cached by user (and user groups) and language, until the
+        next change to the database.
+        """
+        if getattr(self.database, 'has_changed', False):
+            return self._get_menu_tree(context, use_first_child)
+
+        user = context.user
+        user_groups = set(['everybody'])
+        if user:
+            user_groups.add('authenticated')
+            user_groups.update(user.get_value('groups'))
+        languages = context.root.get_value('website_languages')
+        language = context.accept_language.select_language(languages)
+        key = (str(self.abspath), str(user.abspath) if user else None,
+               frozenset(user_groups), language, use_first_child)
+        tree = menu_trees.get(key)
+        if tree is None:
+            if len(menu_trees) >= menu_trees_size:
+                menu_trees.clear()
+            tree = menu_trees[key] = self._get_menu_tree(context,
+                                                         use_first_child)
+        return tree
+
+
+    def _get_menu_tree(self, context, use_first_child):
+        menu_abspath = self.abspath
+        items = []
+
+        # Check the 'view' permission on all the targets with one search,
+        # the checks done by '_is_allowed_to_access' are then cached
+        resources = list(self.get_resources_in_order())
+        targets = []
+        for resource in resources:
+            ref, path, view = split_reference(resource.get_value('path'))
+            if ref is not None and path and not ref.scheme:
+                targets.append(self.get_resource(path, soft=True))
+        context.root.filter_allowed(context.user, 'view', targets)
+
+        for resource in resources:
             uri = resource.get_value('path')
             if not self._is_allowed_to_access(context, uri):
                 continue
@@ -156,17 +258,16 @@ class MenuItem(OrderedFolder):
                     'real_path': None,
                     'title': title,
                     'description': None,
-                    'in_path': False,
-                    'active': False,
                     'class': None,
                     'target': target,
+                    'abspath_and_view': None,
+                    'original_abspath': None,
                     'items': []})
                 continue
 
             # Case 2: Internal link
             # Sub level
-            subtabs = resource.get_menu_namespace_level(context, url,
-                                                        use_first_child)
+            subtabs = resource._get_menu_tree(context, use_first_child)
             resource = self.get_resource(path, soft=True)
             item_id = 'menu_%s' % resource.name
 
@@ -181,8 +282,6 @@ class MenuItem(OrderedFolder):
                 if sub_path is not None:
                     resource_path = sub_path
 
-            # Set active, in_path
-            active = in_path = False
             # add default view
             if view:
                 resource_method = view[2:]
@@ -191,17 +290,6 @@ class MenuItem(OrderedFolder):
                 resource_method = resource.get_default_view_name()
             resource_abspath_and_view = '%s/;%s' % (resource.abspath,
                                                     resource_method)
-            if here_abspath_and_view == resource_abspath_and_view:
-                active = True
-            else:
-                # Use the original path for the highlight
-                res_abspath = menu_abspath.resolve2(resource_original_path)
-                common_prefix = here_abspath.get_prefix(res_abspath)
-                # Avoid to always set the root entree 'in_path'
-                # If common prefix equals root abspath set in_path to False
-                # otherwise compare common_prefix and res_abspath
-                if common_prefix != Path('/'):
-                    in_path = (common_prefix == res_abspath)
 
             # Build the new reference with the right path
             ref2 = deepcopy(ref)
@@ -219,32 +307,13 @@ class MenuItem(OrderedFolder):
                 'real_path': resource.abspath,
                 'title': title,
                 'description': None, # FIXME
-                'in_path': active or in_path,
-                'active': active,
                 'class': None,
                 'target': target,
+                'abspath_and_view': resource_abspath_and_view,
+                'original_abspath': menu_abspath.resolve2(
+                    resource_original_path),
                 'items': subtabs})
 
-        # Set class
-        x = None
-        for i, item in enumerate(items):
-            if item['active']:
-                x = i
-                break
-            if item['in_path'] and x is None:
-                x = i
-                break
-        if x is not None:
-            items[x]['class'] = 'in-path'
-
-        if len(items) > 0:
-            # Add class "first" to the first item
-            css = items[0]['class'] or ''
-            items[0]['class'] = css + ' first'
-            # Add class "last" to the last item
-            css = items[-1]['class'] or ''
-            items[-1]['class'] = css + ' last'
-
         return items
 
 
@@ -30,13 +30,11 @@ from itools.core import prototype
 from itools.database.ro import ro_database
 from itools.datatypes import String
 from itools.fs import lfs
-from itools.i18n import has_language
 from itools.i18n import format_datetime, format_date, format_time
 from itools.i18n import AcceptLanguageType, format_number
 from itools.uri import normalize_path
 from itools.uri import decode_query, get_reference, Path, Reference
 from itools.web.context import get_form_value
-from itools.web.entities import Entity
 from itools.web import ERROR
 from itools.web.headers import get_type
 from itools.web.utils import NewJSONEncoder, fix_json, reason_phrases
@@ -44,7 +42,8 @@ from itools.web.exceptions import InvalidJWTSignatureException
 from itools.web.exceptions import JWTExpiredException
 
 # Import from ikaaro
-from skins import skin_registry
+from skins import get_skin_folder_index, skin_registry
+from ikaaro.web.multipart import check_body_size, parse_multipart
 from constants import JWT_EXPIRE, JWT_ISSUER
 from constants import SESSION_KEY
 from server import get_server
@@ -55,12 +54,17 @@ log = getLogger("ikaaro.web")
 class CMSContext(prototype):
 
     accept_language = AcceptLanguageType.decode('')
+    batch_cursors = None # Set by the browse views (keyset pagination)
     body = {}
+    caches = None # See 'get_context_cache' in database.py
+    caches_generation = 0
+    catalog_flush = None # Group commit
     commit = True
     content_type = None
     session = None
     cookies = {}
     database = None
+    defer_text = False # Full-text indexation deferred to the text queue
     entity = None
     environ = {}
     form = {}
@@ -72,6 +76,7 @@ class CMSContext(prototype):
     mtime = None # Last-Modified
     path_query_base = None
     query = {}
+    read_only = False # Shares the database lock with other readers
     request_time = 0
     resource = None
     root = None
@@ -162,8 +167,6 @@ class CMSContext(prototype):
         else:
             # The authenticated user
             self.authenticate()
-        # Search
-        self._context_user_search = self._user_search(self.user)
         self.site_root.before_traverse(self)  # Hook
         # Not a cron
         self.is_cron = False
@@ -219,23 +222,22 @@ class CMSContext(prototype):
 
     def get_template_from_skin_key(self, skin_key, web_path, warning):
         local_path = skin_key + web_path
+        # The skin folders are listed once, in development they may change
+        folder_path, name = local_path.rsplit('/', 1)
+        server = self.server
+        refresh = bool(server and server.is_development_environment())
+        names, variants = get_skin_folder_index(skin_key, folder_path, refresh)
+
         # 3. Get the handler
-        handler = ro_database.get_handler(local_path, soft=True)
-        if handler:
-            if warning:
-                log.warning(warning)
-            return handler
+        if name in names:
+            handler = ro_database.get_handler(local_path, soft=True)
+            if handler:
+                if warning:
+                    log.warning(warning)
+                return handler
 
         # 4. Not an exact match: trigger language negotiation
-        folder_path, name = local_path.rsplit('/', 1)
-        name = name + '.'
-        n = len(name)
-        languages = []
-        for x in lfs.get_names(folder_path):
-            if x[:n] == name:
-                language = x[n:]
-                if has_language(language):
-                    languages.append(language)
+        languages = variants.get(name)
         if not languages:
             return None
 
@@ -485,6 +487,14 @@ class CMSContext(prototype):
             content_type = response
         # Case 1: nothing
         length = int(self.environ.get('CONTENT_LENGTH', '0') or 0)
+        if not length:
+            return {}
+        # Refuse the too big bodies before reading them
+        check_body_size(length, self.server.max_upload_size)
+        # The multipart bodies are parsed while read
+        if content_type and content_type.startswith('multipart/'):
+            # Case 3: multipart
+            return self.get_multipart_body(length)
         body = self.environ['wsgi.input'].read(length)
         if not body:
             return {}
@@ -495,52 +505,16 @@ class CMSContext(prototype):
         elif content_type == 'application/json':
             # Case 2: json
             return self.get_json_body(body)
-        elif content_type.startswith('multipart/'):
-            # Case 3: multipart
-            return self.get_multipart_body(body)
         elif content_type.startswith('application/'):
             return {'body': body}
         # Case 4: Not managed content type
         raise ValueError('Invalid content type "{0}"'.format(content_type))
 
 
-    def get_multipart_body(self, body):
+    def get_multipart_body(self, length):
         content_type, type_parameters = self.get_header('content-type')
         boundary = type_parameters.get('boundary')
-        boundary = '--%s' % boundary
-        form = {}
-        for part in body.split(boundary)[1:-1]:
-            # Parse the entity
-            entity = Entity(string=part)
-            # Find out the parameter name
-            header = entity.get_header('Content-Disposition')
-            value, header_parameters = header
-            name = header_parameters['name']
-            # Load the value
-            body = entity.get_body()
-            if 'filename' in header_parameters:
-                filename = header_parameters['filename']
-                if filename:
-                    # Strip the path (for IE).
-                    filename = filename.split('\\')[-1]
-                    # Default content-type, see
-                    # http://tools.ietf.org/html/rfc2045#section-5.2
-                    if entity.has_header('content-type'):
-                        mimetype = entity.get_header('content-type')[0]
-                    else:
-                        mimetype = 'text/plain'
-                    form[name] = filename, mimetype, body
-                else:
-                    form[name] = None
-            else:
-                if name not in form:
-                    form[name] = body
-                else:
-                    if isinstance(form[name], list):
-                        form[name].append(body)
-                    else:
-                        form[name] = [form[name], body]
-        return form
+        return parse_multipart(self.environ['wsgi.input'], boundary, length)
 
     #######################################################################
     # ACL API
@@ -584,9 +558,17 @@ class CMSContext(prototype):
 
     @proto_lazy_property
     def _context_user_search(self):
+        # Computed on the first search, requests that do not search (static
+        # files, 304...) do not query the catalog
         return self._user_search(self.user)
 
 
+    def reset_user_search(self):
+        # The user has changed
+        if '_context_user_search' in self.__dict__:
+            delattr(self, '_context_user_search')
+
+
     def search(self, query=None, user=None, **kw):
         if self.is_cron:
             # If the search is done by a CRON we don't
@@ -603,6 +585,7 @@ class CMSContext(prototype):
     def login(self, user, use_session=True):
         # Set the user
         self.user = user
+        self.reset_user_search()
         session = self.session
         if session and not session.get("user"):
             session.invalidate()
@@ -659,6 +642,7 @@ class CMSContext(prototype):
 
     def logout(self):
         self.user = None
+        self.reset_user_search()
         session = self.session
         if session:
             session.delete()
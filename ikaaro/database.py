@@ -15,9 +15,17 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 # Import from standard library
+from collections import OrderedDict
 from copy import deepcopy
+from logging import getLogger
+from os import getpid, remove, rename
+from os.path import exists
+from weakref import WeakKeyDictionary
 
 # Import from gevent
+from greenlet import getcurrent, settrace
+from gevent import spawn_later
+from gevent.event import AsyncResult, Event
 from gevent.lock import BoundedSemaphore
 
 # Import from itools
@@ -26,35 +34,246 @@ from itools.database import OrQuery, PhraseQuery, AndQuery
 from itools.uri import Path
 from itools.web import get_context, set_context
 
+log = getLogger("ikaaro")
+
+class DatabaseLock(object):
+    """Readers/writer lock on the database.
+
+    Read-only contexts share the lock and run concurrently, contexts that may
+    write hold it alone: they wait for the running readers to finish, and no
+    new reader enters until they are done.
+    """
+
+    def __init__(self):
+        self.writer = BoundedSemaphore(1)
+        self.readers = 0
+        self.no_readers = Event()
+        self.no_readers.set()
+
+
+    def acquire(self, read_only=False):
+        self.writer.acquire()
+        if read_only:
+            self.readers += 1
+            self.no_readers.clear()
+            self.writer.release()
+        else:
+            self.no_readers.wait()
+
+
+    def release(self, read_only=False):
+        if read_only:
+            self.readers -= 1
+            if self.readers == 0:
+                self.no_readers.set()
+        else:
+            self.writer.release()
+
+
+DBSEM = DatabaseLock()
+
+
+# The itools context is a global, when several requests run concurrently each
+# greenlet gets its own context back every time it is switched to.
+greenlet_contexts = WeakKeyDictionary()
+# The greenlet trace installed before ours, if any, it is called too
+previous_trace = None
+trace_installed = False
+
+def switch_context(event, args):
+    if event in ('switch', 'throw'):
+        origin, target = args
+        set_context(greenlet_contexts.get(target))
+    if previous_trace is not None:
+        previous_trace(event, args)
+
+
+def init_concurrent_contexts():
+    """Installs the greenlet trace that switches the contexts, once.  It is
+    required as soon as contexts share the database lock.
+    """
+    global previous_trace, trace_installed
+    if trace_installed:
+        return
+    previous_trace = settrace(switch_context)
+    trace_installed = True
+
+
+###########################################################################
+# Caches cleared by the commits
+###########################################################################
+commit_caches = []
+
+def register_commit_cache(cache, *prefixes):
+    """Registers a process-wide cache (any object with a 'clear' method), it
+    will be cleared every time a resource within one of the given paths
+    (any resource if none given) is changed, and every time the database is
+    changed by another process (pre-fork mode).
+    """
+    commit_caches.append((cache, prefixes))
+
+
+def clear_commit_caches(paths=None):
+    """Clears the caches registered for the given changed paths, or all of
+    them if paths is None.
+    """
+    for cache, prefixes in commit_caches:
+        if paths is None:
+            cache.clear()
+        elif not prefixes:
+            if paths:
+                cache.clear()
+        elif any(is_within(path, prefix)
+                 for path in paths for prefix in prefixes):
+            cache.clear()
+
+
+def is_within(path, prefix):
+    return path == prefix or path.startswith(prefix + '/')
+
+
+
+###########################################################################
+# Caches of the current context
+###########################################################################
+def get_context_cache(database, name, cls=dict):
+    """Returns the dict cache with the given name of the current context,
+    or None if there is no context or if the transaction has changes: the
+    context caches are only used with the committed state of the database.
+    They are emptied when the changes are saved or aborted, and dropped
+    when the context is released.
+    """
+    context = get_context()
+    caches = getattr(context, 'caches', None)
+    if caches is None or getattr(database, 'has_changed', False):
+        return None
+    generation = getattr(database, 'generation', 0)
+    if context.caches_generation != generation:
+        # Changes have been saved or aborted since
+        caches.clear()
+        context.caches_generation = generation
+    cache = caches.get(name)
+    if cache is None:
+        cache = caches[name] = cls()
+    return cache
+
+
+# The maximum number of values memoized by 'get_context_value'
+context_cache_size = 10000
+
+def get_context_value(database, name, key, get_value):
+    """Returns the value for the given key from the context cache with the
+    given name, if not there it is computed with 'get_value(key)' and kept
+    (up to 'context_cache_size' values).  It memoizes the lookups done many
+    times by a request, like the user titles in the browse views.
+    """
+    cache = get_context_cache(database, name)
+    if cache is None:
+        return get_value(key)
+    if key in cache:
+        return cache[key]
+    value = get_value(key)
+    if len(cache) < context_cache_size:
+        cache[key] = value
+    return value
+
+
+# The maximum number of resources kept by the identity map of a context
+identity_map_size = 1000
+
+def get_resource_from_identity_map(database, get_resource, abspath, soft):
+    # The resources {abspath: resource} loaded by the current context, the
+    # least recently used are dropped beyond 'identity_map_size' (a context
+    # traversing the whole database must not keep all of them)
+    resources = get_context_cache(database, 'resources', OrderedDict)
+    if resources is None:
+        return get_resource(abspath, soft=soft)
+    key = str(abspath)
+    resource = resources.pop(key, None)
+    if resource is None:
+        resource = get_resource(abspath, soft=soft)
+        if resource is None:
+            return None
+        if len(resources) >= identity_map_size:
+            resources.popitem(last=False)
+    resources[key] = resource
+    return resource
+
+
+def read_commit_stamp(path):
+    """Returns the counter of the commits of the writer, in the pre-fork
+    mode, or None if the stamp is not there.
+    """
+    try:
+        with open(path) as f:
+            return int(f.read() or 0)
+    except (IOError, ValueError):
+        return None
 
-DBSEM = BoundedSemaphore(1)
 
 
 class RODatabase(BaseRODatabase):
 
-    def init_context(self, user=None, username=None, email=None, commit_at_exit=True):
+    # Pre-fork mode, touched by the writer on every commit
+    commit_stamp = None
+    commit_count = None
+
+    def init_context(self, user=None, username=None, email=None,
+                     commit_at_exit=True, read_only=True):
         from ikaaro.context import CMSContext
         root = self.get_resource('/', soft=True)
         cls = root.context_cls if root else CMSContext
-        return ContextManager(cls, self)
+        # Nothing to commit in a read-only database
+        return ContextManager(cls,
+            database=self, user=user,
+            username=username, email=email,
+            commit_at_exit=False, read_only=read_only)
+
+
+    def get_resource(self, abspath, soft=False):
+        proxy = super(RODatabase, self)
+        return get_resource_from_identity_map(self, proxy.get_resource,
+                                              Path(abspath), soft)
+
+
+    def check_commit_stamp(self):
+        """Drop the handlers loaded before the last commit of the writer.
+        """
+        count = read_commit_stamp(self.commit_stamp)
+        if count is None:
+            return
+        if self.commit_count is not None and count != self.commit_count:
+            self.cache.clear()
+            clear_commit_caches()
+        self.commit_count = count
 
 
 
 class ContextManager(object):
 
-    def __init__(self, cls, database, user=None, username=None, email=None, commit_at_exit=True):
+    def __init__(self, cls, database, user=None, username=None, email=None,
+                 commit_at_exit=True, read_only=False):
         # Check if context is not already locked
         if get_context() != None:
             raise ValueError('Cannot acquire context. Already locked.')
-        # Acquire lock on database
-        DBSEM.acquire()
+        # Acquire lock on database (shared by read-only contexts)
+        self.read_only = read_only
+        if read_only:
+            init_concurrent_contexts()
+        DBSEM.acquire(read_only)
         from server import get_server
         self.context = cls()
         self.context.database = database
         self.context.server = get_server()
-        self.commit_at_exit = commit_at_exit
+        self.context.caches = {}
+        self.commit_at_exit = commit_at_exit and not read_only
+        if read_only:
+            # The router aborts the changes instead of committing them
+            self.context.read_only = True
+            self.context.commit = False
         # Set context
         set_context(self.context)
+        greenlet_contexts[getcurrent()] = self.context
         # Get user by user
         if email:
             query = AndQuery(
@@ -77,20 +296,32 @@ class ContextManager(object):
 
 
     def __exit__(self, exc_type, exc_value, traceback):
+        database = self.context.database
         try:
             if self.commit_at_exit:
-                self.context.database.save_changes()
+                database.save_changes()
+            elif self.read_only:
+                # Other readers share the database, do not leak changes
+                if getattr(database, 'has_changed', False):
+                    log.warning('Changes done in a read-only context have'
+                                ' been aborted')
+                    database.abort_changes()
             else:
-                if self.context.database.has_changed:
-                    msg = 'Warning: Some changes have not been commited'
-                    print(msg)
+                if getattr(database, 'has_changed', False):
+                    log.warning('Some changes have not been commited')
         except Exception:
-            set_context(None)
-            DBSEM.release()
+            self.release()
             raise
         else:
-            set_context(None)
-            DBSEM.release()
+            self.release()
+
+
+    def release(self):
+        # Free the resources loaded by this context
+        self.context.caches = None
+        set_context(None)
+        greenlet_contexts.pop(getcurrent(), None)
+        DBSEM.release(self.read_only)
 
 
 
@@ -102,22 +333,259 @@ class Database(RWDatabase):
     """Adds a Git archive to the itools database.
     """
 
-    def init_context(self, user=None, username=None, email=None, commit_at_exit=True):
+    # Pre-fork mode, touched on every commit
+    commit_stamp = None
+    commit_count = None
+    # Group commit: the catalog is flushed once for all the commits done
+    # within this delay (in seconds), 0 flushes it on every commit
+    group_commit_window = 0
+    catalog_flush = None
+    # Incremented every time the changes are saved or aborted, the resources
+    # and values cached before are then outdated
+    generation = 0
+    # The paths changed by the transaction, for 'clear_commit_caches'
+    changed_paths = frozenset()
+    # Group commit: the documents of the transaction [(abspath, values)],
+    # and of the commits not flushed yet {abspath: values} (None to unindex)
+    commit_docs = None
+
+    def __init__(self, *args, **kw):
+        proxy = super(Database, self)
+        proxy.__init__(*args, **kw)
+        self.pending_docs = {}
+        # The resources to push to the queues once committed [(queue, path)]
+        self.queued_paths = []
+
+
+    def init_context(self, user=None, username=None, email=None,
+                     commit_at_exit=True, read_only=False):
         from ikaaro.context import CMSContext
         root = self.get_resource('/', soft=True)
         cls = root.context_cls if root else CMSContext
         return ContextManager(cls,
             database=self, user=user,
             username=username, email=email,
-            commit_at_exit=commit_at_exit)
+            commit_at_exit=commit_at_exit, read_only=read_only)
 
 
     def close(self):
+        # Flush the pending commits
+        if self.catalog_flush:
+            self._flush_catalog()
         # Close
         proxy = super(Database, self)
         return proxy.close()
 
 
+    def save_changes(self, *args, **kw):
+        # Other readers share the database, a read-only context cannot commit
+        context = get_context()
+        if context is not None and getattr(context, 'read_only', False):
+            if self.has_changed:
+                log.warning("Changes done in a read-only context have been"
+                            " aborted ({})".format(context.uri))
+                self.abort_changes()
+            return
+        try:
+            ret = self._save_changes(*args, **kw)
+        finally:
+            queued_paths, self.queued_paths = self.queued_paths, []
+        # Committed
+        for queue, abspath in queued_paths:
+            queue.push(abspath)
+        return ret
+
+
+    def _save_changes(self, *args, **kw):
+        proxy = super(Database, self)
+        if not self.group_commit_window:
+            ret = proxy.save_changes(*args, **kw)
+            self.touch_commit_stamp()
+            return ret
+
+        # Group commit: git commit now, flush the catalog later, once for
+        # all the commits done within the window.  The documents to index
+        # are kept aside by '_before_commit', they are indexed by the flush.
+        try:
+            ret = proxy.save_changes(*args, **kw)
+        finally:
+            commit_docs, self.commit_docs = self.commit_docs, None
+        if commit_docs is not None:
+            pending_docs = self.pending_docs
+            for abspath, values in commit_docs:
+                pending_docs[abspath] = values
+            self.defer_catalog_flush()
+        return ret
+
+
+    def push_after_commit(self, queue, abspath):
+        """Pushes the given resource to the given queue (the text or the
+        thumbnail queue) once the changes are committed, nothing is pushed
+        if they are aborted.
+        """
+        self.queued_paths.append((queue, abspath))
+
+
+    def _abort_changes(self, *args, **kw):
+        self.changed_paths = self.changed_paths | self.get_changed_paths()
+        self.queued_paths = []
+        # The pending catalog changes belong to commits already done
+        if self.catalog_flush:
+            self._flush_catalog()
+        proxy = super(Database, self)
+        return proxy._abort_changes(*args, **kw)
+
+
+    def _cleanup(self):
+        proxy = super(Database, self)
+        proxy._cleanup()
+        self.generation += 1
+        # Changes saved or aborted
+        clear_commit_caches(self.changed_paths)
+        self.changed_paths = frozenset()
+
+
+    def is_path_changed(self, abspath):
+        """Returns True if the resource with the given path is changed by
+        the transaction.
+        """
+        return (abspath in self.resources_new2old or
+                abspath in self.resources_old2new or
+                abspath in self.changed_paths)
+
+
+    def get_changed_paths(self):
+        paths = set(self.resources_old2new)
+        paths.update(self.resources_new2old)
+        return paths
+
+
+    def get_resource(self, abspath, soft=False):
+        proxy = super(Database, self)
+        return get_resource_from_identity_map(self, proxy.get_resource,
+                                              Path(abspath), soft)
+
+
+    #######################################################################
+    # Group commit
+    #######################################################################
+    def get_pending_flush_path(self):
+        return '%s/catalog_pending' % self.path
+
+
+    def log_pending_flush(self, abspaths):
+        """Records on the disk the paths of the resources indexed but not
+        yet flushed to the catalog, so they are reindexed at startup if the
+        process stops before the flush (see 'reindex_pending_flush').
+        """
+        with open(self.get_pending_flush_path(), 'a') as f:
+            for abspath in abspaths:
+                f.write('%s\n' % abspath)
+
+
+    def reindex_pending_flush(self):
+        """Reindexes the resources whose changes were not flushed to the
+        catalog, because the process stopped before.  Returns the number of
+        resources reindexed.
+        """
+        path = self.get_pending_flush_path()
+        if not exists(path):
+            return 0
+        with open(path) as f:
+            abspaths = set([ x.strip() for x in f if x.strip() ])
+        catalog = self.catalog
+        for abspath in sorted(abspaths):
+            resource = self.get_resource(abspath, soft=True)
+            if resource is None:
+                catalog.unindex_document(abspath)
+            else:
+                catalog.index_document(resource.get_catalog_values())
+        catalog.save_changes()
+        remove(path)
+        log.warning('Reindexed {0} resources not flushed to the catalog'
+                    .format(len(abspaths)))
+        return len(abspaths)
+
+
+    def defer_catalog_flush(self):
+        if self.catalog_flush is None:
+            self.catalog_flush = AsyncResult()
+            spawn_later(self.group_commit_window, self.flush_catalog)
+        # The request is answered once the catalog is flushed
+        context = get_context()
+        if context is not None:
+            context.catalog_flush = self.catalog_flush
+
+
+    def flush_catalog(self):
+        DBSEM.acquire()
+        try:
+            self._flush_catalog()
+        finally:
+            DBSEM.release()
+
+
+    def _flush_catalog(self):
+        result, self.catalog_flush = self.catalog_flush, None
+        if result is None:
+            return
+        pending_docs, self.pending_docs = self.pending_docs, {}
+        catalog = self.catalog
+        try:
+            for abspath in sorted(pending_docs):
+                values = pending_docs[abspath]
+                if values is None:
+                    catalog.unindex_document(abspath)
+                else:
+                    catalog.index_document(values)
+            catalog.save_changes()
+        except Exception as e:
+            log.error("Catalog flush failed", exc_info=True)
+            result.set_exception(e)
+        else:
+            # Flushed
+            path = self.get_pending_flush_path()
+            if exists(path):
+                remove(path)
+            self.touch_commit_stamp()
+            result.set(True)
+
+
+    def save_catalog(self, abspaths, defer=True):
+        """Saves the changes done to the catalog outside of a transaction
+        (the given resources were indexed), the same way the commits do: the
+        catalog flush is deferred with the group commit (unless 'defer' is
+        False), and the read-only workers are notified.
+        """
+        if defer and self.group_commit_window:
+            self.log_pending_flush(abspaths)
+            self.defer_catalog_flush()
+        else:
+            self.catalog.save_changes()
+            self.touch_commit_stamp()
+
+
+    def touch_commit_stamp(self):
+        """Notify the read-only workers: the stamp holds a counter, which is
+        incremented on every commit (several commits may happen within the
+        resolution of the modification time).
+        """
+        if not self.commit_stamp:
+            return
+        if self.commit_count is None:
+            self.commit_count = read_commit_stamp(self.commit_stamp) or 0
+        self.commit_count += 1
+        # Replaced atomically, the workers never read a partial counter
+        tmp_path = '%s.%s' % (self.commit_stamp, getpid())
+        with open(tmp_path, 'w') as f:
+            f.write(str(self.commit_count))
+        rename(tmp_path, self.commit_stamp)
+
+
+    def check_commit_stamp(self):
+        pass
+
+
     def _before_commit(self):
         root = self.get_resource('/')
         context = get_context()
@@ -141,23 +609,25 @@ class Database(RWDatabase):
             resource._on_move_resource(source)
 
         # 2. Find out resources to re-index because they depend on another
-        # resource that changed
+        # resource that changed (breadth-first, every round only looks for
+        # the dependencies of the paths found in the previous one)
         to_reindex = set()
-        aux = set()
-        aux2 = set(self.resources_old2new.keys())
-        while len(aux) != len(aux2):
-            aux = set(aux2)
+        seen = set(self.resources_old2new.keys())
+        frontier = list(seen)
+        while frontier:
+            found = set()
             # XXX we regroup items by 200 because Xapian is slow
             # when there's too much items in OrQuery
-            l_aux = list(aux)
-            for sub_aux in [l_aux[n:n+200] for n in range(0, len(l_aux), 200)]:
-                query = [ PhraseQuery('onchange_reindex', x) for x in sub_aux ]
+            for n in range(0, len(frontier), 200):
+                query = [ PhraseQuery('onchange_reindex', x)
+                          for x in frontier[n:n+200] ]
                 query = OrQuery(*query)
                 search = self.search(query)
                 for brain in search.get_documents():
-                    path = brain.abspath
-                    aux2.add(path)
-                    to_reindex.add(path)
+                    found.add(brain.abspath)
+            to_reindex.update(found)
+            frontier = list(found - seen)
+            seen.update(found)
 
         # 3. Documents to unindex (the update_links methods calls
         # 'change_resource' which may modify the resources_old2new dictionary)
@@ -178,6 +648,7 @@ class Database(RWDatabase):
                     handler.set_property('last_author', userid)
         # Remove from to_reindex if resource has been deleted
         to_reindex = to_reindex - set(docs_to_unindex)
+        self.changed_paths = self.get_changed_paths()
         # 5. Index
         docs_to_index = self.resources_new2old.keys()
         docs_to_index = set(docs_to_index) | to_reindex
@@ -191,6 +662,15 @@ class Database(RWDatabase):
                 aux.append((resource, values))
         docs_to_index = aux
         self.resources_new2old.clear()
+        # Group commit: indexed when the catalog is flushed (see
+        # 'save_changes'), logged in case the process stops before
+        if self.group_commit_window:
+            commit_docs = [ (x, None) for x in docs_to_unindex ]
+            commit_docs += [ (str(x.abspath), y) for x, y in docs_to_index ]
+            self.log_pending_flush([ x for x, y in commit_docs ])
+            self.commit_docs = commit_docs
+            docs_to_index = []
+            docs_to_unindex = []
 
         # 6. Find out commit author & message
         if user:
@@ -215,6 +695,37 @@ class Database(RWDatabase):
         return git_author, git_date, git_msg, docs_to_index, docs_to_unindex
 
 
+    def reindex_resources(self, query, batch_size=500):
+        """Reindexes in place the resources matching the given query, the
+        catalog is saved after every batch.  Returns the number of resources
+        reindexed.  It must be called within a context that holds the
+        database lock (not read-only).
+        """
+        context = get_context()
+        if context is None or getattr(context, 'read_only', False):
+            raise ValueError('the database lock is not held')
+        # The pending commits first, they would overwrite the new values
+        if self.catalog_flush:
+            self._flush_catalog()
+        results = self.search(query)
+        abspaths = [ brain.abspath
+                     for brain in results.get_documents(sort_by='abspath') ]
+        catalog = self.catalog
+        n = 0
+        for i in range(0, len(abspaths), batch_size):
+            batch = abspaths[i:i+batch_size]
+            for abspath in batch:
+                resource = self.get_resource(abspath, soft=True)
+                if resource is None:
+                    continue
+                catalog.index_document(resource.get_catalog_values())
+                n += 1
+            self.save_catalog(batch, defer=False)
+            self.make_room()
+        log.info('Reindexed {0} resources'.format(n))
+        return n
+
+
     def get_dynamic_classes(self):
         search = self.search(base_classes='-model')
         for brain in search.get_documents():
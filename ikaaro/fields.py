@@ -44,6 +44,7 @@ from widgets import CheckboxWidget, RadioWidget, SelectWidget
 from widgets import BirthDateWidget, DateWidget, DatetimeWidget
 from widgets import PasswordWidget, ChoosePassword_Widget
 from widgets import ColorPickerWidget, ProgressBarWidget, RTEWidget
+from web.multipart import is_file_body
 
 
 class Field(BaseField):
@@ -646,6 +647,18 @@ class File_Field(Field):
         if type(value) is tuple:
             filename, mimetype, value = value
 
+        # An uploaded file (see 'parse_multipart'), read once by the handler
+        if is_file_body(value):
+            cls = self.class_handler
+            value.seek(0)
+            if cls is None:
+                mimetype = magic_from_buffer(value.read(4096))
+                cls = get_handler_class_by_mimetype(mimetype)
+                value.seek(0)
+            handler = cls()
+            handler.load_state_from_file(value)
+            return handler
+
         if type(value) is str:
             cls = self.class_handler
             if cls is None:
@@ -879,7 +892,7 @@ class MTime_Field(Datetime_Field):
 class LastAuthor_Field(Char_Field):
 
     title = MSG(u'Last author')
-    indexed = False
+    indexed = True
     stored = True
     readonly = True
 
@@ -36,6 +36,7 @@ from itools.web import get_context
 # Import from ikaaro
 from database import Database
 from fields import Char_Field, File_Field, Owner_Field
+from fulltext import handler_to_text
 from file_views import File_NewInstance, File_View
 from file_views import File_Edit, File_ExternalEdit, File_ExternalEdit_View
 from file_views import File_Download
@@ -89,7 +90,7 @@ class File(DBResource):
     #######################################################################
     def to_text(self):
         data = self.get_value('data')
-        return data and data.to_text() or u''
+        return data and handler_to_text(data) or u''
 
 
     def get_files_to_archive(self, content=False):
@@ -160,6 +161,15 @@ class Image(File):
                 min(ysize, max_height or ysize))
             handler.load_state_from_string(thumb)
 
+
+    def update_resource(self, context):
+        super(Image, self).update_resource(context)
+        # Make the thumbnails in the background, once committed
+        server = context.server
+        if server and server.thumbnail_queue:
+            context.database.push_after_commit(server.thumbnail_queue,
+                                               str(self.abspath))
+
     # Views
     thumb = DBResource_GetImage(field_name='data')
     view = Image_View()
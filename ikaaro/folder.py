@@ -21,9 +21,7 @@
 
 # Import from the Standard Library
 import fnmatch
-from cStringIO import StringIO
 from os.path import basename, dirname
-from zipfile import ZipFile
 
 # Import from itools
 from itools.core import is_prototype
@@ -40,6 +38,9 @@ from itools.web import BaseView, get_context
 # Import from ikaaro
 from views.folder_views import Folder_BrowseContent, Folder_PreviewContent
 from views.folder_views import Folder_Rename, Folder_NewResource, Folder_Thumbnail
+from web.files import get_handler_path
+from web.multipart import read_file_body
+from web.zipstream import ZipStream, get_compress_type
 
 # Import from ikaaro
 from autoedit import AutoEdit
@@ -205,9 +206,10 @@ class Folder(DBResource):
 
         # Web Pages are first class citizens
         if mimetype == 'text/html':
-            body = tidy_html(body)
+            body = tidy_html(read_file_body(body))
             class_id = 'webpage'
         elif mimetype == 'application/xhtml+xml':
+            body = read_file_body(body)
             class_id = 'webpage'
         else:
             class_id = mimetype
@@ -226,15 +228,30 @@ class Folder(DBResource):
 
 
     def export_zip(self, paths):
-        stringio = StringIO()
-        archive = ZipFile(stringio, mode='w')
+        """Returns the ZIP archive of the given resources, as a stream: the
+        files are read from the disk while the archive is sent.
+        """
+        archive = ZipStream()
+        database = self.database
+        base = Path(self.handler.key)
 
         def _add_resource(resource):
-            for filename in resource.get_files_to_archive(True):
-                if filename.endswith('.metadata'):
+            folder_key = resource.metadata.key[:-9]
+            mtime = resource.get_value('mtime')
+            for key in resource.get_files_to_archive(True):
+                if key.endswith('.metadata') or key == folder_key:
                     continue
-                path = Path(self.handler.key).get_pathto(filename)
-                archive.writestr(str(path), resource.handler.to_str())
+                handler = database.get_handler(key, soft=True)
+                if handler is None:
+                    continue
+                name = str(base.get_pathto(key))
+                compress_type = get_compress_type(handler.get_mimetype())
+                path = get_handler_path(handler)
+                if path is None:
+                    archive.add_data(name, handler.to_str(), mtime,
+                                     compress_type)
+                else:
+                    archive.add_file(name, path, mtime, compress_type)
 
         for path in paths:
             child = self.get_resource(path, soft=True)
@@ -249,8 +266,7 @@ class Folder(DBResource):
             else:
                 _add_resource(child)
 
-        archive.close()
-        return stringio.getvalue()
+        return archive
 
 
     def extract_archive(self, handler, default_language, filter=None,
@@ -0,0 +1,246 @@
+# -*- coding: UTF-8 -*-
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Import from the Standard Library
+from hashlib import sha1
+from os import fdopen, listdir, makedirs, remove, rename, stat, utime
+from os.path import basename, dirname, exists, getmtime, isdir
+from tempfile import mkstemp
+from time import time
+
+# Import from itools
+from itools.web import get_context
+
+
+class DiskCache(object):
+    """Persistent cache of files in the given folder, one sub-folder per
+    first two characters of the keys.  When the cache grows over its maximum
+    size (in bytes) the least recently used files are removed.
+    """
+
+    def __init__(self, path, max_size):
+        self.path = path
+        self.max_size = max_size
+        # The size of the cache, computed on the first store
+        self.size = None
+        self.hits = 0
+        self.misses = 0
+
+
+    def touch(self, path):
+        """Returns whether the given file is in the cache, and marks it as
+        used.
+        """
+        try:
+            # The modification time is the last time it was used
+            utime(path, None)
+        except OSError:
+            self.misses += 1
+            return False
+        self.hits += 1
+        return True
+
+
+    def store(self, path, data):
+        folder = dirname(path)
+        if not exists(folder):
+            try:
+                makedirs(folder)
+            except OSError:
+                # Created by another process meanwhile
+                pass
+        # A temporary file of its own, the threads share the pid
+        fd, tmp_path = mkstemp(dir=folder, prefix='%s.' % basename(path))
+        with fdopen(fd, 'w') as f:
+            f.write(data)
+        rename(tmp_path, path)
+        # Evict
+        if self.size is None:
+            self.size = sum([ x[2] for x in self.get_entries() ])
+        else:
+            self.size += len(data)
+        if self.size > self.max_size:
+            self.evict()
+
+
+    def get_entries(self):
+        """Returns the (atime, path, size) of the files in the cache.
+        """
+        entries = []
+        if not isdir(self.path):
+            return entries
+        for folder in listdir(self.path):
+            folder = '%s/%s' % (self.path, folder)
+            if not isdir(folder):
+                continue
+            for name in listdir(folder):
+                path = '%s/%s' % (folder, name)
+                try:
+                    info = stat(path)
+                except OSError:
+                    continue
+                entries.append((info.st_mtime, path, info.st_size))
+        return entries
+
+
+    def evict(self):
+        """Removes the least recently used files, until the cache is down to
+        3/4 of its maximum size (the other processes may have changed it, so
+        the size is computed again).
+        """
+        entries = self.get_entries()
+        entries.sort()
+        size = sum([ x[2] for x in entries ])
+        target = self.max_size * 3 / 4
+        for atime, path, entry_size in entries:
+            if size <= target:
+                break
+            try:
+                remove(path)
+            except OSError:
+                continue
+            size -= entry_size
+        self.size = size
+
+
+
+class TextCache(DiskCache):
+    """Persistent cache of the text extracted from the file handlers for the
+    full-text indexation.  It is keyed by the hash of the handler's data, so
+    the text is only extracted again when the file changes.
+    """
+
+    def get_key(self, handler):
+        cls = handler.__class__
+        key = sha1('%s.%s\0' % (cls.__module__, cls.__name__))
+        key.update(handler.to_str())
+        return key.hexdigest()
+
+
+    def get_text(self, handler, extract=True):
+        """Returns the text of the handler, if it is not in the cache the
+        text is extracted, or if 'extract' is False TextDeferred is raised.
+        """
+        key = self.get_key(handler)
+        path = '%s/%s/%s' % (self.path, key[:2], key)
+        # Hit
+        if self.touch(path):
+            try:
+                with open(path) as f:
+                    return f.read().decode('utf-8')
+            except IOError:
+                # Evicted meanwhile
+                pass
+
+        # Miss
+        if not extract:
+            raise TextDeferred
+        text = handler.to_text() or u''
+        self.store(path, text.encode('utf-8'))
+        return text
+
+
+
+class TextDeferred(Exception):
+    """Raised when the text extraction is deferred to the text queue.
+    """
+
+
+
+class TextQueue(object):
+    """Durable queue of the resources whose text is to be indexed later.
+    There is one file per resource in the given folder, its modification
+    time is the time the resource was queued.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        if not exists(path):
+            makedirs(path)
+
+
+    def get_entry_path(self, abspath):
+        return '%s/%s' % (self.path, sha1(abspath).hexdigest())
+
+
+    def push(self, abspath):
+        path = self.get_entry_path(abspath)
+        if exists(path):
+            # Already queued
+            return
+        fd, tmp_path = mkstemp(dir=self.path, prefix='%s.' % basename(path))
+        with fdopen(fd, 'w') as f:
+            f.write(abspath)
+        rename(tmp_path, path)
+
+
+    def remove(self, abspath):
+        try:
+            remove(self.get_entry_path(abspath))
+        except OSError:
+            pass
+
+
+    def postpone(self, abspath):
+        """Moves the given resource to the end of the queue.
+        """
+        try:
+            utime(self.get_entry_path(abspath), None)
+        except OSError:
+            pass
+
+
+    def get_entries(self):
+        """Returns the (mtime, abspath) of the queued resources, the oldest
+        first.
+        """
+        entries = []
+        for name in listdir(self.path):
+            if '.' in name:
+                # Being written
+                continue
+            path = '%s/%s' % (self.path, name)
+            try:
+                mtime = getmtime(path)
+                with open(path) as f:
+                    abspath = f.read()
+            except (IOError, OSError):
+                continue
+            entries.append((mtime, abspath))
+        entries.sort()
+        return entries
+
+
+    def get_status(self):
+        entries = self.get_entries()
+        lag = time() - entries[0][0] if entries else 0
+        return {'depth': len(entries), 'lag': int(lag)}
+
+
+
+def handler_to_text(handler):
+    """Returns the text of the given handler for the full-text indexation,
+    from the server's text cache if available.  If the extraction is
+    deferred and the text is not in the cache, raises TextDeferred.
+    """
+    context = get_context()
+    server = context.server if context else None
+    text_cache = server.text_cache if server else None
+    defer_text = getattr(context, 'defer_text', False)
+    if text_cache is None:
+        if defer_text:
+            raise TextDeferred
+        return handler.to_text()
+    return text_cache.get_text(handler, extract=not defer_text)
@@ -107,7 +107,8 @@ class AddBase_BrowseContent(Folder_BrowseContent):
                            'search_text': None,
                            'search_type': None,
                            # Reset batch
-                           'batch_start': None}
+                           'batch_start': None,
+                           'batch_cursor': None}
                 url = context.uri.replace(**url_dic)
             else:
                 url = None
@@ -20,6 +20,7 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 # Import from the Standard Library
+from calendar import timegm
 from datetime import datetime
 from logging import getLogger
 from pickle import dumps
@@ -41,6 +42,7 @@ from itools.web import ItoolsView, get_context
 from autoadd import AutoAdd
 from autoedit import AutoEdit
 from enumerates import Groups_Datatype
+from fulltext import TextDeferred
 from fields import Char_Field, Datetime_Field, File_Field, HTMLFile_Field
 from fields import SelectAbspath_Field, Text_Field, Textarea_Field, UUID_Field
 from fields import CTime_Field, MTime_Field, LastAuthor_Field
@@ -52,12 +54,23 @@ from resource_views import DBResource_Links, DBResource_Backlinks
 from resource_views import LoginView, LogoutView
 from resource_views import DBResource_GetFile, DBResource_GetImage
 from update import class_version_to_date
-from utils import get_resource_by_uuid_query
+from utils import get_resource_by_uuid_query, make_sortkey
 from widgets import CheckboxWidget
 
 log = getLogger("ikaaro")
 
 
+def copy_value(value):
+    """The cached values are copied, so the callers can modify them.
+    """
+    if type(value) is list:
+        return list(value)
+    if type(value) is dict:
+        return dict(value)
+    return value
+
+
+
 class Share_Field(SelectAbspath_Field):
 
     title = MSG(u'Share')
@@ -83,6 +96,7 @@ class DBResource(Resource):
     # Internal
     _values = {}
     _values_title = {}
+    _values_generation = 0
     _metadata = None
     _brain = None
 
@@ -332,11 +346,11 @@ class DBResource(Resource):
         if field.obsolete:
             msg = 'field {name} is obsolete on {class_id}'
             log.warning(msg.format(name=name, class_id=self.class_id))
-        # TODO: Use decorator for cache
-        # TODO: Reactivate when ready
-        #cache_key = (name, language)
-        #if self._values.has_key(cache_key):
-        #    return self._values[cache_key]
+        # Cache
+        cache = self.get_values_cache()
+        cache_key = (name, language)
+        if cache is not None and cache_key in cache:
+            return copy_value(cache[cache_key])
         if self._brain and field.stored and not is_prototype(field.datatype, Decimal):
             try:
                 value = self.get_value_from_brain(name, language)
@@ -349,7 +363,8 @@ class DBResource(Resource):
                 value = field.get_value(self, name, language)
         else:
             value = field.get_value(self, name, language)
-        #self._values[cache_key] = value
+        if cache is not None:
+            cache[cache_key] = copy_value(value)
         return value
 
 
@@ -384,26 +399,46 @@ class DBResource(Resource):
 
 
     def clear_cache(self, name, language):
-        cache_key = (name, language)
-        if self._values.get(cache_key):
-            del self._values[cache_key]
-        if self._values_title.get(cache_key):
-            del self._values_title[cache_key]
+        # The values of multilingual fields may be cached with the language
+        # negotiated (language=None), clear all the languages
+        for cache in (self._values, self._values_title):
+            for cache_key in cache.keys():
+                if cache_key[0] == name:
+                    del cache[cache_key]
         self._brain = None
 
 
+    def get_values_cache(self):
+        """Returns the cache of the field values {(name, language): value},
+        or None if the values cannot be cached: while the transaction has
+        changes the values are always read from the metadata.
+        """
+        database = self.database
+        if getattr(database, 'has_changed', False):
+            return None
+        generation = getattr(database, 'generation', 0)
+        if self._values_generation != generation:
+            # Changes have been saved or aborted since
+            self._values = {}
+            self._values_title = {}
+            self._values_generation = generation
+        return self._values
+
+
     def get_value_title(self, name, language=None, mode=None):
-        # TODO: Use decorator for cache
-        # TODO: Reactivate when ready
-        #cache_key = (name, language)
-        #if (self._values_title.has_key(cache_key) and
-        #    self._values_title[cache_key].has_key(mode)):
-        #    return self._values_title[cache_key][mode]
+        # Cache
+        cache = self.get_values_cache()
+        cache_key = (name, language)
+        if cache is not None:
+            cache = self._values_title.setdefault(cache_key, {})
+            if mode in cache:
+                return copy_value(cache[mode])
         field = self.get_field(name)
         if field is None:
             return None
         value_title = field.get_value_title(self, name, language, mode)
-        #self._values_title.setdefault(cache_key, {})[mode] = value_title
+        if cache is not None:
+            cache[mode] = copy_value(value_title)
         return value_title
 
 
@@ -588,6 +623,31 @@ class DBResource(Resource):
         values['format'] = self.metadata.format
         values['base_classes'] = self.get_base_classes()
         values['class_version'] = class_version_to_date(self.metadata.version)
+        # Sort keys (see Folder_BrowseContent.sort_keys), the abspath breaks
+        # the ties so they can be used for the keyset pagination
+        if self.get_field('title'):
+            titles = [ self.get_value('title', language=x) for x in languages ]
+        else:
+            titles = [ None for x in languages ]
+        default_title = ([ x for x in titles if x ] or [None])[0]
+        title_sortkey = {}
+        format_title_sortkey = {}
+        for language, title in zip(languages, titles):
+            title_sortkey[language] = make_sortkey(title or default_title,
+                                                   values['abspath'])
+            class_title = self.class_title.gettext(language=language)
+            format_title_sortkey[language] = make_sortkey(class_title,
+                                                          values['abspath'])
+        values['title_sortkey'] = title_sortkey
+        values['format_title_sortkey'] = format_title_sortkey
+        last_author = root.get_user_title(self.get_value('last_author'))
+        values['last_author_title_sortkey'] = make_sortkey(last_author,
+                                                          values['abspath'])
+        mtime = self.get_value('mtime')
+        if mtime is not None:
+            mtime = '%014d.%06d' % (timegm(mtime.utctimetuple()),
+                                    mtime.microsecond)
+        values['mtime_sortkey'] = '%s\0%s' % (mtime or '', values['abspath'])
         # Links to other resources
         values['owner'] = self.get_owner()
         values['share'] = self.get_share()
@@ -597,10 +657,19 @@ class DBResource(Resource):
         context = get_context()
         server = context.server
         if server and server.index_text:
+            # Deferred to the text queue, unless the text is in the cache
+            # (only within the web requests, a rebuild indexes everything)
+            text_queue = server.text_queue
+            context.defer_text = (text_queue is not None and
+                                  bool(context.environ))
             try:
                 values['text'] = self.to_text()
+            except TextDeferred:
+                context.database.push_after_commit(text_queue, str(abspath))
             except Exception as e:
                 log.error("Indexation failed: {}".format(abspath), exc_info=True)
+            finally:
+                context.defer_text = False
         # Time events for the CRON
         reminder, payload = self.next_time_event()
         values['next_time_event'] = reminder
@@ -903,6 +972,11 @@ register_field('name', String(stored=True, indexed=True))
 register_field('format', String(indexed=True, stored=True))
 register_field('base_classes', String(multiple=True, indexed=True))
 register_field('class_version', Date(indexed=True, stored=True))
+# Sort keys
+register_field('title_sortkey', Unicode(stored=True))
+register_field('format_title_sortkey', Unicode(stored=True))
+register_field('last_author_title_sortkey', Unicode(stored=True))
+register_field('mtime_sortkey', String(stored=True))
 # Referential integrity
 register_field('links', String(multiple=True, indexed=True))
 register_field('onchange_reindex', String(multiple=True, indexed=True))
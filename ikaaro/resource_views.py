@@ -31,7 +31,10 @@ from itools.web import BaseView, STLView, INFO, ERROR
 from itools.web import Conflict, NotFound, NotImplemented
 
 # Import from ikaaro
+from ikaaro.thumbnails import get_handler_hash, get_image_format
 from ikaaro.views.folder_views import Folder_BrowseContent
+from ikaaro.web.files import FileEntity, check_etag
+from ikaaro.web.files import get_file_response, get_handler_path
 
 # Import from ikaaro
 from autoform import AutoForm
@@ -124,6 +127,10 @@ class DBResource_GetFile(BaseView):
         disposition = 'attachment'
         filename = self.get_filename(handler, field_name, resource)
         context.set_content_disposition(disposition, filename)
+        # Stream the file from the disk (with support for ranges)
+        path = get_handler_path(handler)
+        if path is not None:
+            return get_file_response(context, path)
         # Ok
         return handler.to_str()
 
@@ -145,23 +152,54 @@ class DBResource_GetImage(DBResource_GetFile):
         language = context.query['language']
         handler = self.get_handler(resource, field_name, language)
 
-        image_width, image_height = handler.get_size()
         fit = context.query['fit']
         lossy = context.query['lossy']
-        width = context.query['width'] or image_width
-        height = context.query['height'] or image_height
+        width = context.query['width']
+        height = context.query['height']
 
+        # Headers
+        context.set_header('Cache-Control', 'private, no-cache')
+        if context.mtime:
+            context.set_header('Last-Modified', context.mtime)
+
+        # The thumbnails cache, the key is made from the version of the file
+        # and the parameters: the image is not loaded unless it is a miss
+        cache = context.server.thumbnail_cache
+        key = key_format = None
+        path = get_handler_path(handler) if cache is not None else None
+        if path is not None:
+            if lossy:
+                key_format = 'jpeg'
+            else:
+                key_format = get_image_format(handler, path)
+        if path is not None and key_format is not None:
+            image_hash = get_handler_hash(handler)
+            key = cache.get_key(image_hash, width, height, key_format, fit,
+                                lossy)
+            check_etag(context, '"%s"' % key)
+            path = cache.get(key, key_format)
+            if path is not None:
+                context.set_content_type('image/%s' % key_format)
+                return FileEntity(path)
+
+        # Miss
+        image_width, image_height = handler.get_size()
+        width = width or image_width
+        height = height or image_height
         format = 'jpeg'
         if lossy is False:
             format = handler.get_mimetype().split('/')[1]
-        data, format = handler.get_thumbnail(width, height, format, fit)
+        data, thumbnail_format = handler.get_thumbnail(width, height, format,
+                                                       fit)
         if data is None:
             default = context.get_template('/ui/ikaaro/icons/48x48/image.png')
             data = default.to_str()
-            format = 'png'
+            thumbnail_format = 'png'
+        elif key is not None and thumbnail_format == key_format:
+            cache.set(key, key_format, data)
 
         # Headers
-        context.set_content_type('image/%s' % format)
+        context.set_content_type('image/%s' % thumbnail_format)
 
         # Ok
         return data
@@ -48,6 +48,7 @@ from constants import DEBUG
 from config import Configuration
 from config_register import RegisterForm, TermsOfService_View
 from context import CMSContext
+from database import register_commit_cache
 from fields import Char_Field
 from folder import Folder
 from resource_views import LoginView
@@ -56,6 +57,7 @@ from root_views import PoweredBy, ContactForm
 from root_views import NotFoundView, ForbiddenView, NotAllowedView
 from root_views import UploadStatsView, UpdateDocs, UnavailableView
 from update import UpdateInstanceView
+from utils import LRUCache
 
 log = getLogger("ikaaro")
 
@@ -72,6 +74,12 @@ add_codec('utf-8', 'utf_8')
 
 
 
+# Cleared when a user is changed
+user_titles = LRUCache(1000)
+register_commit_cache(user_titles, '/users')
+
+
+
 class CtrlView(BaseView):
 
     access = True
@@ -89,6 +97,18 @@ class CtrlView(BaseView):
 ###########################################################################
 # Resource
 ###########################################################################
+# The permissions checked by the 'is_allowed_to_<action>' methods of the root
+action_permissions = {
+    'view': 'view',
+    'edit': 'edit',
+    'add': 'add',
+    'share': 'share',
+    'put': 'edit',
+    'remove': 'edit',
+    'copy': 'edit',
+    'move': 'edit'}
+
+
 class Root(Folder):
 
     class_id = 'iKaaro'
@@ -134,14 +154,30 @@ class Root(Folder):
         if userid[0] != '/':
             userid = '/users/%s' % userid
 
+        # Cache (only the committed state of the user, during a commit the
+        # other users are still found there)
+        cache = user_titles
+        database = self.database
+        if getattr(database, 'has_changed', False):
+            if database.is_path_changed(userid):
+                cache = None
+        if cache is not None:
+            title = cache.get(userid)
+            if title is not None:
+                return title
+
         # Get user
         user = self.get_resource(userid, soft=True)
         if user is None:
             username = userid.rsplit('/', 1)[-1]
             log.warning('unkwnown user {}'.format(username))
-            return unicode(username)
+            title = unicode(username)
+        else:
+            title = user.get_title()
         # Ok
-        return user.get_title()
+        if cache is not None:
+            cache.set(userid, title)
+        return title
 
 
     ########################################################################
@@ -540,6 +576,38 @@ class Root(Folder):
         return access.has_permission(user, permission, resource, class_id)
 
 
+    def filter_allowed(self, user, permission, resources, class_id=None):
+        """Returns the resources, of the given list, for which the user has
+        the given permission, checked with one search instead of one search
+        per resource (unless 'has_permission' is overridden).
+        """
+        resources = [ x for x in resources if x is not None ]
+        if not resources:
+            return []
+        # The site has its own policy: check every resource
+        method = self.has_permission
+        if getattr(method, 'im_func', None) is not Root.has_permission.im_func:
+            return [ x for x in resources
+                     if method(user, permission, x, class_id) ]
+        access = self.get_resource('config/access')
+        return access.filter_allowed(user, permission, resources, class_id)
+
+
+    def filter_allowed_to(self, user, action, resources):
+        """Returns the resources, of the given list, that the user is allowed
+        to change with the given action ('remove', 'copy', 'move', ...).
+        The permission is checked with one search, unless the method
+        'is_allowed_to_<action>' is overridden: then it is called for every
+        resource.
+        """
+        name = 'is_allowed_to_%s' % action
+        method = getattr(self, name)
+        if getattr(method, 'im_func', None) is getattr(Root, name).im_func:
+            permission = action_permissions[action]
+            return self.filter_allowed(user, permission, resources)
+        return [ x for x in resources if x is not None and method(user, x) ]
+
+
     def is_allowed_to_view(self, user, resource):
         return self.has_permission(user, 'view', resource)
 
@@ -43,6 +43,7 @@ from config_captcha import CaptchaDatatype, CaptchaWidget
 from datatypes import FileDataType
 from folder import Folder
 from messages import MSG_UNEXPECTED_MIMETYPE
+from web.multipart import read_file_body
 from widgets import FileWidget
 from widgets import HiddenWidget, SelectWidget, MultilineWidget, TextWidget
 
@@ -340,7 +341,7 @@ class UpdateDocs(AutoForm):
         # 2. Extract
         filename, mimetype, body = form['file']
         cls = get_handler_class_by_mimetype(mimetype)
-        handler = cls(string=body)
+        handler = cls(string=read_file_body(body))
         docs.extract_archive(handler, language, filter, postproc, True)
 
         # Ok
@@ -29,7 +29,8 @@ from logging import getLogger
 import inspect
 import json
 import pickle
-from os import fdopen, getpgid, getpid, kill, mkdir, remove, path
+from multiprocessing import Pool
+from os import fdopen, getpgid, getpid, kill, mkdir, remove, rename, path
 from os.path import join
 from psutil import pid_exists
 import sys
@@ -48,10 +49,11 @@ from jwcrypto.jwk import JWK
 # Import from gevent
 from gevent.pywsgi import WSGIServer, WSGIHandler
 from gevent.signal import signal as gevent_signal
+from gevent.threadpool import ThreadPool
 
 # Import from itools
 from itools.core import become_daemon, vmsize
-from itools.database import Metadata, RangeQuery
+from itools.database import Metadata, PhraseQuery, RangeQuery
 from itools.database import make_database, get_register_fields
 from itools.datatypes import Boolean, Email, Integer, String, Tokens
 from itools.fs import lfs
@@ -68,8 +70,12 @@ from itools.web.router import RequestMethod
 # Import from ikaaro.web
 from database import get_database
 from datatypes import ExpireValue
+from fulltext import TextCache, TextQueue
 from views import CachedStaticView
-from skins import skin_registry
+from skins import get_skin_index, skin_registry
+from thumbnails import ThumbnailCache, ThumbnailQueue, get_image_format
+from utils import get_reindex_query
+from web.files import get_handler_path
 from views import IkaaroStaticView
 
 log_ikaaro = getLogger("ikaaro")
@@ -139,9 +145,32 @@ database-readonly = 0
 # The "index-text" variable defines whether the catalog must process full-text
 # indexing. It requires (much) more time and third-party applications.
 # To speed up catalog updates, set this option to 0 (default is 1).
+# The extracted text is cached in the "cache/text" folder, it is extracted
+# again only when the file changes.
 #
 index-text = 1
 
+# The "index-text-deferred" variable, when set to 1, defers the full-text
+# indexing of the files: the commit indexes the other fields right away and
+# queues the resource, its text is indexed later in the background (unless
+# it is already in the text cache).  The default is 0.
+#
+index-text-deferred = 0
+
+# The "concurrent-reads" variable, when set to 1, lets the read-only requests
+# (GET, HEAD, OPTIONS) run concurrently; only the requests that may write to
+# the database are serialized (default is 0, all requests are serialized).
+#
+concurrent-reads = 0
+
+# The "group-commit" variable defines a delay in milliseconds. The catalog is
+# flushed to disk once for all the commits done within this delay, instead of
+# once per commit; every request is answered after its changes are flushed.
+# Useful when many small changes are done at the same time (default is 0, the
+# catalog is flushed on every commit).
+#
+group-commit = 0
+
 # The "accept-cors" variable defines whether the web server accept
 # cross origin requests or not.
 # To accept cross origin requests, set this option to 1 (default is 1)
@@ -154,6 +183,41 @@ accept-cors = 1
 max-width =
 max-height =
 
+# The "max-upload-size" variable defines the maximum size, in megabytes, of a
+# request body (for instance a file upload).  Bigger requests are refused with
+# the 413 status, before the body is read.  The default is 0, no limit.
+#
+max-upload-size = 0
+
+# The "text-cache-size" variable defines the maximum size, in megabytes, of
+# the cache of the text extracted from the files for the full-text indexing
+# (the "cache/text" folder).  The least recently used texts are removed when
+# it is full.  Set it to 0 to disable the cache (default is 100).
+#
+text-cache-size = 100
+
+# The "thumbnail-cache-size" variable defines the maximum size, in megabytes,
+# of the thumbnails cache (the "cache/thumbnails" folder).  The thumbnails of
+# the images are computed once and kept there, the least recently used ones
+# are removed when it is full.  Set it to 0 to disable the cache (default is
+# 100).
+#
+thumbnail-cache-size = 100
+
+# The "thumbnail-sizes" variable lists the sizes (width x height) of the
+# thumbnails made in the background once an image is uploaded, so they are
+# ready when first requested.  Leave it empty to make the thumbnails only on
+# demand.
+#
+thumbnail-sizes = 48x48 128x128 800x600
+
+# The "workers" variable defines the number of worker processes. If greater
+# than 1 the server forks the workers, one of them (the writer) handles all the
+# requests that may write to the database, the other ones handle read-only
+# requests. If 0 or 1 (the default) requests are handled by a single process.
+#
+workers = 0
+
 # Allow to customize wsgi application
 wsgi_application = ikaaro.web.wsgi
 """)
@@ -275,6 +339,44 @@ def create_server(target, email, password, root,
 
 
 
+###########################################################################
+# Parallel catalog rebuild (worker processes)
+###########################################################################
+reindex_context = None
+
+def init_reindex_worker(target, size_min, size_max):
+    global reindex_context
+    database = get_database(target, size_min, size_max, read_only=True)
+    reindex_context = database.init_context()
+    reindex_context.__enter__()
+
+
+def get_reindex_values(paths):
+    """Returns the catalog values of the resources with the given paths,
+    None if they could not be computed.
+    """
+    context = reindex_context.context
+    database = context.database
+    results = []
+    for abspath in paths:
+        resource = database.get_resource(abspath, soft=True)
+        if resource is None:
+            continue
+        context.resource = resource
+        try:
+            values = resource.get_catalog_values()
+        except Exception:
+            log_ikaaro.error("Cannot compute the catalog values of {}".format(
+                abspath), exc_info=True)
+            values = None
+        results.append((abspath, values))
+        # Free Memory
+        del resource
+        database.make_room()
+    return results
+
+
+
 server = None
 def get_server():
     return server
@@ -370,12 +472,25 @@ class Server(object):
     database = None
     session_timeout = timedelta(0)
     accept_cors = False
+    concurrent_reads = False
+    group_commit = 0
+    text_cache = None
+    text_queue = None
+    text_queue_batch_size = 20
+    thumbnail_cache = None
+    thumbnail_queue = None
+    thumbnail_queue_batch_size = 20
+    thumbnail_pool = None
+    thumbnail_sizes = ()
+    thumbnail_workers = 2
+    workers = 0
     dispatcher = URIDispatcher()
     wsgi_server = None
+    writer_wsgi_server = None
 
 
     def __init__(self, target, read_only=False, cache_size=None,
-                 profile_space=False, port=None):
+                 profile_space=False, port=None, workers=None):
         set_server(self)
         target = lfs.get_absolute_path(target)
         self.target = target
@@ -392,11 +507,43 @@ class Server(object):
             self.port = int(port)
         else:
             self.port = self.config.get_value('listen-port')
+        # Number of worker processes
+        if workers is not None:
+            self.workers = int(workers)
+        else:
+            self.workers = config.get_value('workers')
         # Contact Email
         self.smtp_from = config.get_value('smtp-from')
 
         # Full-text indexing
         self.index_text = config.get_value('index-text', type=Boolean, default=True)
+        if self.index_text:
+            text_cache_size = config.get_value('text-cache-size') or 0
+            if text_cache_size:
+                self.text_cache = TextCache('%s/cache/text' % target,
+                                            text_cache_size * 1048576)
+            if config.get_value('index-text-deferred'):
+                self.text_queue = TextQueue('%s/spool_text' % target)
+        # Run read-only requests concurrently
+        self.concurrent_reads = config.get_value('concurrent-reads')
+        # Flush the catalog once for the commits done within this delay
+        self.group_commit = config.get_value('group-commit')
+        # The thumbnails of the images
+        thumbnail_cache_size = config.get_value('thumbnail-cache-size') or 0
+        self.thumbnail_cache = None
+        if thumbnail_cache_size:
+            self.thumbnail_cache = ThumbnailCache(
+                '%s/cache/thumbnails' % target, thumbnail_cache_size * 1048576)
+            # Made in the background once the images are committed
+            sizes = config.get_value('thumbnail-sizes')
+            if sizes:
+                self.thumbnail_sizes = [ tuple(map(int, x.split('x')))
+                                         for x in sizes ]
+                self.thumbnail_queue = ThumbnailQueue(
+                    '%s/spool_thumbnails' % target)
+        # The maximum size of the request bodies, in bytes (0 for no limit)
+        max_upload_size = config.get_value('max-upload-size') or 0
+        self.max_upload_size = max_upload_size * 1048576
         # Accept cors
         self.accept_cors = config.get_value(
             'accept-cors', type=Boolean, default=False)
@@ -413,6 +560,7 @@ class Server(object):
         else:
             size_min = size_max = cache_size
         size_min, size_max = int(size_min), int(size_max)
+        self.database_size = (size_min, size_max)
         read_only = read_only or config.get_value('database-readonly')
         # Get database
         database = get_database(target, size_min, size_max, read_only)
@@ -420,6 +568,11 @@ class Server(object):
         # Find out the root class
         root = get_root(database)
         self.root = root
+        # Group commit: reindex the changes not flushed to the catalog when
+        # the server stopped
+        if not read_only and lfs.exists(database.get_pending_flush_path()):
+            with database.init_context(commit_at_exit=False):
+                database.reindex_pending_flush()
         # Load environment file
         root_file_path = inspect.getfile(root.__class__)
         environement_path = str(get_reference(root_file_path).resolve('environment.json'))
@@ -486,10 +639,29 @@ class Server(object):
         database = self.database
         # Reopen so if we have one readonly request it will works
         database.backend.catalog._db.reopen()
+        # Pre-fork mode: read-only workers see the commits of the writer
+        if database.commit_stamp:
+            database.check_commit_stamp()
         # Ok
         return database
 
 
+    def open_database(self, read_only):
+        size_min, size_max = self.database_size
+        database = get_database(self.target, size_min, size_max, read_only)
+        self.database = database
+        self.root = get_root(database)
+        return database
+
+
+    def get_commit_stamp_path(self):
+        return join(self.target, 'commit.stamp')
+
+
+    def get_writer_path(self):
+        return join(self.target, 'writer.sock')
+
+
     def check_consistency(self, quick):
         log_ikaaro.info("Check database consistency")
         # Check the server is not running
@@ -526,6 +698,11 @@ class Server(object):
         # Call method on root at start
         with self.database.init_context() as context:
             context.root.launch_at_start(context)
+        # Pre-fork mode
+        if self.workers > 1:
+            from web.prefork import Arbiter
+            Arbiter(self, address, self.port, self.workers).run()
+            return True
         # Listen & set context
         if not self.read_only:
             self.launch_cron()
@@ -542,20 +719,39 @@ class Server(object):
         interval = self.config.get_value('cron-interval')
         if interval:
             cron(self.cron_manager, interval)
+        # Deferred full-text indexation
+        if self.text_queue:
+            cron(self.index_text_queue, timedelta(seconds=1))
+        # Thumbnails of the new images
+        if self.thumbnail_queue:
+            self.thumbnail_pool = ThreadPool(self.thumbnail_workers)
+            cron(self.make_queued_thumbnails, timedelta(seconds=1))
+
 
+    # Save the catalog being rebuilt every this number of documents
+    reindex_checkpoint_interval = 1000
 
-    def reindex_catalog(self, quiet=False, quick=False, as_test=False):
+    def reindex_catalog(self, quiet=False, quick=False, as_test=False,
+                        jobs=1, resume=False):
         # FIXME: should be moved into backend
-        from itools.database.backends.catalog import make_catalog
-        log_ikaaro.info('reindex catalog %s %s %s' % (quiet, quick, as_test))
+        from itools.database.backends.catalog import Catalog, make_catalog
+        log_ikaaro.info('reindex catalog %s %s %s %s %s' % (quiet, quick,
+                        as_test, jobs, resume))
         if self.is_running_in_rw_mode():
             log_ikaaro.error("Cannot proceed, the server is running in read-write mode.")
             return
-        # Create a temporary new catalog
+        # Create a temporary new catalog (or continue the interrupted one)
         catalog_path = '%s/catalog.new' % self.target
-        if lfs.exists(catalog_path):
-            lfs.remove(catalog_path)
-        catalog = make_catalog(catalog_path, get_register_fields())
+        checkpoint = self.load_reindex_checkpoint() if resume else None
+        if checkpoint and lfs.exists(catalog_path):
+            log_ikaaro.info('Resume from {0} {1}'.format(
+                checkpoint['doc_n'], checkpoint['abspath']))
+            catalog = Catalog(catalog_path, get_register_fields())
+        else:
+            resume = False
+            if lfs.exists(catalog_path):
+                lfs.remove(catalog_path)
+            catalog = make_catalog(catalog_path, get_register_fields())
         # Get the root
         root = self.root
         # Update
@@ -564,30 +760,42 @@ class Server(object):
         error_detected = False
         if as_test:
             log = open('%s/log/update-catalog' % self.target, 'w').write
-        with self.database.init_context() as context:
-            for obj in root.traverse_resources():
-                if not quiet or doc_n % 10000 == 0:
-                    log_ikaaro.info('{0} {1}'.format(doc_n, obj.abspath))
-                doc_n += 1
-                context.resource = obj
-                values = obj.get_catalog_values()
-                # Index the document
-                try:
-                    catalog.index_document(values)
-                except Exception as e:
-                    if as_test:
-                        error_detected = True
-                        log_ikaaro.error("Error, Abspath of the resource: {}".format(str(obj.abspath)))
-                    else:
-                        raise
-                # Free Memory
-                del obj
-                self.database.make_room()
+        if jobs > 1:
+            doc_n, error_detected = self.reindex_catalog_parallel(catalog,
+                jobs, quiet, as_test, resume)
+        else:
+            with self.database.init_context() as context:
+                for obj in root.traverse_resources():
+                    abspath = str(obj.abspath)
+                    if not quiet or doc_n % 10000 == 0:
+                        self.log_reindex_progress(doc_n, abspath, t0)
+                    doc_n += 1
+                    # Indexed before the interruption
+                    if resume and self.is_reindexed(catalog, abspath):
+                        continue
+                    context.resource = obj
+                    values = obj.get_catalog_values()
+                    # Index the document
+                    try:
+                        catalog.index_document(values)
+                    except Exception as e:
+                        if as_test:
+                            error_detected = True
+                            log_ikaaro.error("Error, Abspath of the resource: {}".format(str(obj.abspath)))
+                        else:
+                            raise
+                    # Checkpoint
+                    if doc_n % self.reindex_checkpoint_interval == 0:
+                        self.save_reindex_checkpoint(catalog, doc_n, abspath)
+                    # Free Memory
+                    del obj
+                    self.database.make_room()
 
         if not error_detected:
             if as_test:
                 # Delete the empty log file
                 remove('%s/log/update-catalog' % self.target)
+            self.remove_reindex_checkpoint()
 
             # Update / Report
             t1, v1 = time(), vmsize()
@@ -613,6 +821,117 @@ class Server(object):
             return False
 
 
+    def reindex_catalog_parallel(self, catalog, jobs, quiet=False,
+                                 as_test=False, resume=False):
+        """The catalog values are computed by 'jobs' worker processes, the
+        documents are indexed by this process as they come back.
+        """
+        # Fork the workers first, they open their own (read-only) database
+        size_min, size_max = self.database_size
+        pool = Pool(jobs, init_reindex_worker,
+                    (self.target, size_min, size_max))
+        try:
+            # Split the resource tree into shards
+            doc_n = 0
+            paths = []
+            with self.database.init_context():
+                for obj in self.root.traverse_resources():
+                    abspath = str(obj.abspath)
+                    if resume and self.is_reindexed(catalog, abspath):
+                        # Indexed before the interruption
+                        doc_n += 1
+                    else:
+                        paths.append(abspath)
+                    del obj
+                    self.database.make_room()
+            shards = [ paths[n:n+100] for n in range(0, len(paths), 100) ]
+            # Index
+            t0 = time()
+            error_detected = False
+            for results in pool.imap_unordered(get_reindex_values, shards):
+                for abspath, values in results:
+                    if not quiet or doc_n % 10000 == 0:
+                        self.log_reindex_progress(doc_n, abspath, t0)
+                    doc_n += 1
+                    try:
+                        if values is None:
+                            raise ValueError('no catalog values')
+                        catalog.index_document(values)
+                    except Exception:
+                        if as_test:
+                            error_detected = True
+                            log_ikaaro.error("Error, Abspath of the resource: {}".format(abspath))
+                        else:
+                            raise
+                    # Checkpoint
+                    if doc_n % self.reindex_checkpoint_interval == 0:
+                        self.save_reindex_checkpoint(catalog, doc_n, abspath)
+        except Exception:
+            pool.terminate()
+            raise
+        else:
+            pool.close()
+        pool.join()
+        return doc_n, error_detected
+
+
+    def reindex_resources(self, class_id=None, base_abspath=None,
+                          mtime_from=None, mtime_to=None, batch_size=500):
+        """Reindexes in place only the selected resources, for instance the
+        resources of a class after a new field has been indexed.
+        """
+        log_ikaaro.info('reindex resources %s %s %s %s' % (class_id,
+                        base_abspath, mtime_from, mtime_to))
+        if self.is_running_in_rw_mode():
+            log_ikaaro.error("Cannot proceed, the server is running in read-write mode.")
+            return
+        query = get_reindex_query(class_id, base_abspath, mtime_from,
+                                  mtime_to)
+        with self.database.init_context(commit_at_exit=False):
+            return self.database.reindex_resources(query, batch_size)
+
+
+    def get_reindex_checkpoint_path(self):
+        return '%s/log/update-catalog.checkpoint' % self.target
+
+
+    def load_reindex_checkpoint(self):
+        try:
+            with open(self.get_reindex_checkpoint_path()) as f:
+                return json.loads(f.read())
+        except (IOError, ValueError):
+            return None
+
+
+    def save_reindex_checkpoint(self, catalog, doc_n, abspath):
+        """Saves the catalog being rebuilt, so the rebuild can be resumed
+        from here if it is interrupted.
+        """
+        catalog.save_changes()
+        checkpoint = {'doc_n': doc_n, 'abspath': abspath, 'time': time()}
+        path = self.get_reindex_checkpoint_path()
+        with open(path + '.tmp', 'w') as f:
+            f.write(json.dumps(checkpoint))
+        rename(path + '.tmp', path)
+
+
+    def remove_reindex_checkpoint(self):
+        try:
+            remove(self.get_reindex_checkpoint_path())
+        except OSError:
+            pass
+
+
+    def is_reindexed(self, catalog, abspath):
+        return len(catalog.search(PhraseQuery('abspath', abspath))) > 0
+
+
+    def log_reindex_progress(self, doc_n, abspath, t0):
+        rate = doc_n / (time() - t0 or 1)
+        log_ikaaro.info('{0} {1} ({2:.01f} docs/s)'.format(doc_n, abspath,
+                                                            rate))
+
+
     def get_pid(self):
         return get_pid('%s/pid' % self.target)
 
@@ -641,6 +960,8 @@ class Server(object):
         # Stop wsgi server
         if self.wsgi_server:
             self.wsgi_server.stop()
+        if self.writer_wsgi_server:
+            self.writer_wsgi_server.stop()
         # Close database
         self.close()
 
@@ -649,6 +970,12 @@ class Server(object):
         self.stop()
 
 
+    def get_wsgi_application(self):
+        wsgi_module = self.config.get_value("wsgi_application")
+        wsgi_module = import_module(wsgi_module)
+        return getattr(wsgi_module, "application")
+
+
     def listen(self, address, port):
         # Language negotiation
         init_language_selector(select_language)
@@ -660,11 +987,45 @@ class Server(object):
         if address == '*':
             address = ''
         self.port = port
-        wsgi_module = self.config.get_value("wsgi_application")
-        wsgi_module = import_module(wsgi_module)
-        application = getattr(wsgi_module, "application")
+        application = self.get_wsgi_application()
+        self.serve((address or '', port), application)
+
+
+    def run_worker(self, listener, is_writer):
+        """Pre-fork mode, serve the requests from the given listener. The
+        writer opens the database in read-write mode, the other workers open
+        it read-only and forward to the writer the requests that may write.
+        """
+        from web.prefork import forward_writes, make_listener, trust_forwarded
+        init_language_selector(select_language)
+        read_only = self.read_only or self.config.get_value('database-readonly')
+        database = self.open_database(read_only or not is_writer)
+        application = self.get_wsgi_application()
+        if not read_only:
+            database.commit_stamp = self.get_commit_stamp_path()
+            writer_path = self.get_writer_path()
+            if is_writer:
+                log_ikaaro.info("Writer worker {}".format(getpid()))
+                self.launch_cron()
+                self.writer_wsgi_server = WSGIServer(
+                    make_listener(writer_path),
+                    trust_forwarded(application),
+                    handler_class=ServerHandler,
+                    log=log_access
+                )
+                self.writer_wsgi_server.start()
+            else:
+                log_ikaaro.info("Read-only worker {}".format(getpid()))
+                application = forward_writes(application, writer_path,
+                                             self.max_upload_size)
+        self.serve(listener, application)
+
+
+    def serve(self, listener, application):
+        if self.group_commit:
+            self.database.group_commit_window = self.group_commit / 1000.0
         self.wsgi_server = WSGIServer(
-            (address or '', port),
+            listener,
             application,
             handler_class=ServerHandler,
             log=log_access
@@ -819,6 +1180,9 @@ class Server(object):
             skin = skin_registry[name]
             mount_path = '/ui/%s' % name
             skin_key = skin.get_environment_key(self)
+            # Index the templates of the skins once
+            get_skin_index(skin_key)
+            get_skin_index(skin.key)
             view = IkaaroStaticView(local_path=skin_key, mount_path=mount_path)
             self.dispatcher.add('/ui/%s/{name:any}' % name, view)
             mount_path = '/ui/cached/%s/%s' % (ts, name)
@@ -912,6 +1276,78 @@ class Server(object):
 
 
 
+    def index_text_queue(self):
+        """Indexes the text of the resources in the text queue, by batches.
+        """
+        entries = self.text_queue.get_entries()
+        if not entries:
+            return 5
+        database = self.database
+        # Group commit: wait for the commit to be indexed first
+        entries = [ x for x in entries if x[1] not in database.pending_docs ]
+        entries = entries[:self.text_queue_batch_size]
+        if not entries:
+            return 1
+        with database.init_context(commit_at_exit=False):
+            catalog = database.catalog
+            for mtime, abspath in entries:
+                resource = database.get_resource(abspath, soft=True)
+                if resource is not None:
+                    values = resource.get_catalog_values()
+                    catalog.index_document(values)
+            database.save_catalog([ x for mtime, x in entries ])
+            # Indexed
+            for mtime, abspath in entries:
+                self.text_queue.remove(abspath)
+        # Again, and again
+        return 1
+
+
+    def make_queued_thumbnails(self):
+        """Makes the thumbnails of the images in the thumbnail queue, by
+        batches.  They are made by the thread pool, once the database is
+        released.
+        """
+        entries = self.thumbnail_queue.get_entries()
+        if not entries:
+            return 5
+        database = self.database
+        queue = self.thumbnail_queue
+        jobs = []
+        with database.init_context(commit_at_exit=False) as context:
+            for mtime, abspath in entries[:self.thumbnail_queue_batch_size]:
+                resource = database.get_resource(abspath, soft=True)
+                handler = resource.get_value('data') if resource else None
+                path = get_handler_path(handler) if handler else None
+                # The same key as DBResource_GetImage
+                format = get_image_format(handler, path) if path else None
+                if format is not None:
+                    jobs.append((abspath, path, handler.__class__, format))
+                else:
+                    # Nothing to make
+                    queue.remove(abspath)
+        # Make the thumbnails
+        cache = self.thumbnail_cache
+        results = [
+            (abspath, self.thumbnail_pool.spawn(cache.make_thumbnails, path,
+                                                cls, format,
+                                                self.thumbnail_sizes))
+            for abspath, path, cls, format in jobs ]
+        # The entries are removed once the thumbnails are stored
+        for abspath, result in results:
+            try:
+                result.get()
+            except Exception:
+                log_ikaaro.error("Thumbnails failed: {}".format(abspath),
+                                 exc_info=True)
+                # Try again later, after the other entries
+                queue.postpone(abspath)
+            else:
+                queue.remove(abspath)
+        # Again, and again
+        return 1
+
+
     def do_request(self, method='GET', path='/', headers=None, body='',
             context=None, as_json=False, as_multipart=False, files=None, user=None, cookies=None):
         """Experimental method to do a request on the server"""
@@ -1032,9 +1468,17 @@ class ServerConfig(ConfigFile):
         'database-size': String(default='19500:20500'),
         'database-readonly': Boolean(default=False),
         'index-text': Boolean(default=True),
+        'index-text-deferred': Boolean(default=False),
+        'concurrent-reads': Boolean(default=False),
+        'group-commit': Integer(default=0),
         'max-width': Integer(default=None),
         'max-height': Integer(default=None),
+        'max-upload-size': Integer(default=0),
+        'text-cache-size': Integer(default=100),
+        'thumbnail-cache-size': Integer(default=100),
+        'thumbnail-sizes': Tokens(default=('48x48', '128x128', '800x600')),
         'accept-cors': Integer(default=1),
+        'workers': Integer(default=0),
         'wsgi_application': String(default="ikaaro.web.wsgi"),
     }
 
@@ -20,20 +20,30 @@
 
 # Import from the Standard Library
 from copy import deepcopy
-from os.path import isfile
+from os import walk
+from os.path import isfile, normpath
 
 # Import from itools
 from itools.core import get_abspath
 from itools.datatypes import Unicode
 from itools.fs import lfs
 from itools.gettext import MSG
+from itools.i18n import has_language
 from itools.stl import stl
 from itools.web import get_context, ERROR, INFO
 
 # Import from ikaaro
+from database import register_commit_cache
 from folder import Folder
 from views import get_view_scripts
 from skins_views import LanguagesTemplate, LocationTemplate, TabsTemplate
+from utils import LRUCache
+
+
+# The fragments of the page wrapper shared by the requests {key: value},
+# cleared when the configuration (theme, footer, seo, groups...) changes
+skin_fragments = LRUCache(1000)
+register_commit_cache(skin_fragments, '/config')
 
 
 class Skin(object):
@@ -65,6 +75,33 @@ class Skin(object):
                 return new_key
         return self.key
 
+    #######################################################################
+    # Fragments cache
+    #######################################################################
+    def get_fragment(self, context, name, get_value):
+        """Returns the fragment of the page wrapper with the given name, built
+        by 'get_value(context)'.  It is shared by the requests with the same
+        language and user groups, until the configuration changes.
+        """
+        if getattr(context.database, 'has_changed', False):
+            return get_value(context)
+
+        root = context.root
+        languages = root.get_value('website_languages')
+        language = context.accept_language.select_language(languages)
+        user_groups = set(['everybody'])
+        user = context.user
+        if user:
+            user_groups.add('authenticated')
+            user_groups.update(user.get_value('groups'))
+        key = (self.key, name, language, frozenset(user_groups))
+        value = skin_fragments.get(key)
+        if value is None:
+            value = get_value(context)
+            skin_fragments.set(key, value)
+        return value
+
+
     #######################################################################
     # HTML head
     #######################################################################
@@ -120,7 +157,7 @@ class Skin(object):
         styles.extend(extra)
 
         # Database style
-        if self._get_theme_file(context, 'style'):
+        if self.get_fragment(context, 'style', self._get_theme_style):
             styles.append(
                 '/config/theme/;get_file?name=style&mimetype=text/css')
 
@@ -128,6 +165,10 @@ class Skin(object):
         return styles
 
 
+    def _get_theme_style(self, context):
+        return self._get_theme_file(context, 'style') is not None
+
+
     def get_scripts(self, context):
         scripts = [
             '/ui/ikaaro/jquery.js',
@@ -180,7 +221,20 @@ class Skin(object):
                              'content': value})
 
         # Search engine optimization
-        seo = root.get_resource('config/seo')
+        meta.extend(self.get_fragment(context, 'seo', self.get_seo_meta_tags))
+
+        # View
+        # meta are defined as a tuple (name, content, language)
+        extra_meta = getattr(context.view, 'meta', [])
+        for (name, content, lang) in extra_meta:
+            meta.append({'name': name, 'content': content, 'lang': lang})
+
+        return meta
+
+
+    def get_seo_meta_tags(self, context):
+        seo = context.root.get_resource('config/seo')
+        meta = []
         for key, meta_name in [
             ('google_site_verification', 'google-site-verification'),
             ('yahoo_site_verification', 'y_key'),
@@ -190,13 +244,6 @@ class Skin(object):
                 meta.append({'name': meta_name,
                              'lang': None,
                              'content': verification_key})
-
-        # View
-        # meta are defined as a tuple (name, content, language)
-        extra_meta = getattr(context.view, 'meta', [])
-        for (name, content, lang) in extra_meta:
-            meta.append({'name': name, 'content': content, 'lang': lang})
-
         return meta
 
 
@@ -291,8 +338,12 @@ class Skin(object):
 
 
     def get_footer(self, context):
+        return self.get_fragment(context, 'footer', self._get_footer)
+
+
+    def _get_footer(self, context):
         footer = context.root.get_resource('config/footer')
-        return footer.get_html_data()
+        return list(footer.get_html_data())
 
 
     def get_menu_namespace(self, context):
@@ -309,11 +360,11 @@ class Skin(object):
         context_menus = list(context_menus)
 
         # The favicon.ico
-        favicon_href, favicon_type = self.get_favicon(context)
+        favicon_href, favicon_type = self.get_fragment(context, 'favicon',
+                                                       self.get_favicon)
 
         # Logo
-        logo = self._get_theme_file(context, 'logo')
-        logo_href = '/config/theme/;get_file?name=logo' if logo else None
+        logo_href = self.get_fragment(context, 'logo', self._get_logo_href)
 
         # The document language
         languages = context.root.get_value('website_languages')
@@ -359,6 +410,11 @@ class Skin(object):
         }
 
 
+    def _get_logo_href(self, context):
+        logo = self._get_theme_file(context, 'logo')
+        return '/config/theme/;get_file?name=logo' if logo else None
+
+
     def get_template(self, context):
         paths = [
             '%s/template.xhtml' % self.base_path,
@@ -406,6 +462,52 @@ class FancyboxSkin(Skin):
 # The folder "/ui"
 #############################################################################
 
+# The files of the skins {skin key: {folder path: (names, variants)}}, see
+# 'get_skin_index'
+skin_indexes = {}
+
+def index_skin_folder(names):
+    """Returns the names of the files of a skin folder (a set), and the
+    languages of the templates with language variants, for example
+    {'browse.xml': ['en', 'fr']}.
+    """
+    variants = {}
+    for x in names:
+        if '.' in x:
+            name, language = x.rsplit('.', 1)
+            if has_language(language):
+                variants.setdefault(name, []).append(language)
+    return set(names), variants
+
+
+def get_skin_index(skin_key):
+    """Returns the index of the folders of the given skin {folder path:
+    (names, variants)}.  The skin is walked once (when the server starts,
+    see 'register_dispatch_routes'), the folders are never probed later.
+    """
+    index = skin_indexes.get(skin_key)
+    if index is None:
+        index = {}
+        for folder_path, folders, files in walk(skin_key):
+            index[normpath(folder_path)] = index_skin_folder(folders + files)
+        skin_indexes[skin_key] = index
+    return index
+
+
+def get_skin_folder_index(skin_key, folder_path, refresh=False):
+    """Returns the (names, variants) of the given folder of the given skin,
+    see 'index_skin_folder'.  A folder that is not in the index of the skin
+    does not exist.  If 'refresh' is True (in development) the folder is
+    listed again.
+    """
+    if refresh:
+        if not lfs.is_folder(folder_path):
+            return set(), {}
+        return index_skin_folder(lfs.get_names(folder_path))
+    index = get_skin_index(skin_key)
+    return index.get(normpath(folder_path)) or (set(), {})
+
+
 skin_registry = {}
 def register_skin(name, skin):
     if isinstance(skin, str):
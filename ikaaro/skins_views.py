@@ -102,15 +102,23 @@ class LocationTemplate(CMSTemplate):
             'name': title,
             'short_name': reduce_string(title, 15, 30)}]
 
-        # Complete the breadcrumb
+        # The resources in the path
+        resources = []
         resource = root
         for name in context.uri.path:
-            path = path + ('%s/' % name)
             resource = resource.get_resource(name, soft=True)
             if resource is None:
                 break
+            resources.append((name, resource))
+        allowed = root.filter_allowed_to(context.user, 'view',
+                                         [ x for name, x in resources ])
+        allowed = set([ str(x.abspath) for x in allowed ])
+
+        # Complete the breadcrumb
+        for name, resource in resources:
+            path = path + ('%s/' % name)
             # Display resource title only if allowed
-            if not root.is_allowed_to_view(context.user, resource):
+            if str(resource.abspath) not in allowed:
                 title = name
             else:
                 title = resource.get_title()
@@ -0,0 +1,120 @@
+# -*- coding: UTF-8 -*-
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Import from the Standard Library
+from hashlib import sha1
+
+# Import from ikaaro
+from fulltext import DiskCache, TextQueue
+from ikaaro.web.files import get_file_version, get_handler_path
+
+
+def get_handler_hash(handler):
+    """Returns the hash of the data of the given image handler.  For the
+    files stored on the disk it is the version of the file (the file is not
+    read).
+    """
+    path = get_handler_path(handler)
+    if path is not None:
+        return get_file_version(path)
+    return sha1(handler.to_str()).hexdigest()
+
+
+
+# The signatures of the image formats (the first bytes of the files)
+image_signatures = [
+    ('\x89PNG\r\n\x1a\n', 'png'),
+    ('\xff\xd8\xff', 'jpeg'),
+    ('GIF87a', 'gif'),
+    ('GIF89a', 'gif')]
+
+
+def get_image_format(handler, path):
+    """Returns the format ('png', 'jpeg'...) of the image of the given
+    handler, stored in the given file.  Only the signature of the file is
+    read, the image is not loaded.  Returns None if it is not known.
+    """
+    try:
+        with open(path) as f:
+            header = f.read(8)
+    except IOError:
+        return None
+    for signature, format in image_signatures:
+        if header.startswith(signature):
+            return format
+    # The handler class may be specific (e.g. SVG)
+    mimetypes = getattr(handler.__class__, 'class_mimetypes', [])
+    if len(mimetypes) == 1 and '/' in mimetypes[0]:
+        return mimetypes[0].split('/')[1]
+    return None
+
+
+
+class ThumbnailCache(DiskCache):
+    """Persistent cache of the thumbnails of the images, keyed by the hash
+    of the image and the thumbnail parameters.
+    """
+
+    def get_key(self, image_hash, width, height, format, fit, lossy):
+        key = '%s\0%s\0%s\0%s\0%d\0%d' % (image_hash, width, height, format,
+                                          fit, lossy)
+        return sha1(key).hexdigest()
+
+
+    def get_path(self, key, format):
+        return '%s/%s/%s.%s' % (self.path, key[:2], key, format)
+
+
+    def get(self, key, format):
+        """Returns the path of the thumbnail, or None if it is not in the
+        cache.
+        """
+        path = self.get_path(key, format)
+        if self.touch(path):
+            return path
+        return None
+
+
+    def set(self, key, format, data):
+        path = self.get_path(key, format)
+        self.store(path, data)
+        return path
+
+
+    def make_thumbnails(self, path, cls, format, sizes):
+        """Makes the thumbnails of the given sizes [(width, height), ...] of
+        the image stored in the given file, unless they are in the cache
+        already.  It does not use the database, so it can be run in a thread.
+        """
+        image_hash = get_file_version(path)
+        handler = None
+        for width, height in sizes:
+            key = self.get_key(image_hash, width, height, format, False, False)
+            if self.get(key, format) is not None:
+                continue
+            if handler is None:
+                with open(path) as f:
+                    handler = cls(string=f.read())
+            data, thumbnail_format = handler.get_thumbnail(width, height,
+                                                           format)
+            if data is not None and thumbnail_format == format:
+                self.set(key, format, data)
+
+
+
+class ThumbnailQueue(TextQueue):
+    """Durable queue of the images whose thumbnails are to be made in the
+    background.
+    """
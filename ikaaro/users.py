@@ -18,7 +18,7 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 # Import from itools
-from itools.database import register_field
+from itools.database import PhraseQuery, register_field
 from itools.datatypes import Boolean, String
 from itools.gettext import MSG
 from itools.web import ERROR, get_context
@@ -236,6 +236,21 @@ class User(Folder):
         return self.get_login_name().decode('utf-8')
 
 
+    def set_value(self, name, value, language=None, **kw):
+        if name not in ('firstname', 'lastname', self.login_name_property):
+            return super(User, self).set_value(name, value, language, **kw)
+        title = self.get_title()
+        result = super(User, self).set_value(name, value, language, **kw)
+        # The resources last edited by the user are sorted by its title
+        # (see 'last_author_title_sortkey')
+        if self.get_title() != title:
+            database = self.database
+            query = PhraseQuery('last_author', self.name)
+            for resource in database.search(query).get_resources():
+                database.change_resource(resource)
+        return result
+
+
     login_name_property = 'email'
     def get_login_name(self):
         return self.get_value(self.login_name_property)
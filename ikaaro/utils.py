@@ -17,7 +17,10 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 # Import from the Standard Library
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from collections import OrderedDict
 from hashlib import sha1, sha256
+from json import dumps, loads
 from random import sample
 
 # Import from other modules
@@ -31,6 +34,7 @@ from itools.database import AllQuery, AndQuery, PhraseQuery, OrQuery
 from itools.database import RangeQuery
 from itools.datatypes import Unicode
 from itools.handlers import checkid
+from itools.handlers.utils import transmap
 from itools.html import HTMLParser, stream_to_str_as_xhtml
 from itools.stl import STLTemplate, stl_namespaces
 from itools.uri import get_reference, Reference
@@ -290,6 +294,47 @@ def get_base_path_query(path, min_depth=1, max_depth=None):
     return query
 
 
+###########################################################################
+# Caches
+###########################################################################
+class LRUCache(object):
+    """LRU cache {key: value} shared by the requests of the process (see
+    'register_commit_cache'), with the hits and misses counters.  The None
+    values are not cached.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.values = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+
+    def __len__(self):
+        return len(self.values)
+
+
+    def get(self, key):
+        value = self.values.pop(key, None)
+        if value is None:
+            self.misses += 1
+            return None
+        # Now it is the most recently used
+        self.values[key] = value
+        self.hits += 1
+        return value
+
+
+    def set(self, key, value):
+        self.values[key] = value
+        if len(self.values) > self.size:
+            self.values.popitem(last=False)
+
+
+    def clear(self):
+        self.values.clear()
+
+
 ###########################################################################
 # Used by *_links and menu
 ###########################################################################
@@ -317,6 +362,147 @@ def split_reference(ref):
         path = path[:-1]
     return ref, path, view
 
+###########################################################################
+# Sort
+###########################################################################
+def make_sortkey(value, abspath=None):
+    """
+    Return the key to sort the given text, ignoring case and accents
+    :param value: An unicode string
+    :param abspath: If given it is appended to the key, to break the ties
+    :return: The sort key, None for an empty value
+    """
+    if abspath is not None:
+        return u'%s\0%s' % (make_sortkey(value) or u'', abspath)
+    if not value:
+        return None
+    return value.lower().translate(transmap)
+
+
+###########################################################################
+# Keyset pagination
+###########################################################################
+def encode_cursor(sort_by, key, backwards=False):
+    """
+    Return the opaque cursor to browse the results from the given key
+    :param sort_by: The name of the field the results are sorted by
+    :param key: The value of the field, where to start from (excluded)
+    :param backwards: Whether the page is the one before the key
+    :return: The cursor (a string)
+    """
+    return urlsafe_b64encode(dumps([sort_by, key, backwards]))
+
+
+def decode_cursor(cursor):
+    """
+    Return the (sort_by, key, backwards) tuple of the given cursor, None if
+    the cursor is not valid
+    """
+    try:
+        sort_by, key, backwards = loads(urlsafe_b64decode(cursor))
+    except (TypeError, ValueError):
+        return None
+    return str(sort_by), key, bool(backwards)
+
+
+def get_keyset_page(results, sort_by, reverse=False, size=20, cursor=None):
+    """
+    Return a page of the search results, starting from the cursor.  Unlike
+    the 'start' parameter of 'get_documents', the cost does not depend on
+    the position of the page.
+    :param results: The search results
+    :param sort_by: The name of a stored field, its values must be unique
+                    (like 'abspath', or the keys built with 'make_sortkey')
+    :param reverse: Whether the results are sorted from greater to smaller
+    :param size: The size of the page
+    :param cursor: The cursor of the page, None for the first page
+    :return: The (documents, previous, next) tuple, 'previous' and 'next'
+             are the cursors of the previous and next pages (or None)
+    """
+    if not size:
+        return results.get_documents(sort_by, reverse), None, None
+
+    if cursor:
+        cursor = decode_cursor(cursor)
+    # Ignore the cursor of another sort
+    if cursor is None or cursor[0] != sort_by:
+        key, backwards = None, False
+    else:
+        sort_by, key, backwards = cursor
+
+    # Search from the key, the page before is searched in the reverse order
+    order = (not reverse) if backwards else reverse
+    page = results
+    if key is not None:
+        if order:
+            page = results.search(RangeQuery(sort_by, None, key))
+        else:
+            page = results.search(RangeQuery(sort_by, key, None))
+    # One more document (to know if there is another page), and the key
+    # itself which is included by the range
+    documents = page.get_documents(sort_by, order, 0, size + 2)
+    documents = [ x for x in documents if getattr(x, sort_by) != key ]
+    more = len(documents) > size
+    documents = documents[:size]
+    if backwards:
+        if not documents:
+            # Nothing before the key (removed meanwhile), the first page
+            return get_keyset_page(results, sort_by, reverse, size)
+        documents.reverse()
+        has_previous, has_next = more, True
+    else:
+        has_previous, has_next = key is not None, more
+
+    # Cursors
+    previous = next = None
+    if documents:
+        if has_previous:
+            key = getattr(documents[0], sort_by)
+            previous = encode_cursor(sort_by, key, True)
+        if has_next:
+            key = getattr(documents[-1], sort_by)
+            next = encode_cursor(sort_by, key)
+    return documents, previous, next
+
+
+def get_estimated_total(results, check_at_least=100):
+    """
+    Return an estimation of the number of documents found, exact up to
+    'check_at_least' documents.  It is cheaper than 'len(results)' which
+    goes through all the documents.
+    """
+    # The search results of itools do not expose the estimation
+    enquire = getattr(results, '_enquire', None)
+    if enquire is None:
+        return len(results)
+    return enquire.get_mset(0, 0, check_at_least).get_matches_estimated()
+
+
+###########################################################################
+# Reindex
+###########################################################################
+def get_reindex_query(class_id=None, base_abspath=None, mtime_from=None,
+                      mtime_to=None):
+    """
+    Return the query to select the resources to reindex
+    :param class_id: The class id of the resources, or of one of their bases
+    :param base_abspath: Only the resources within this path (included)
+    :param mtime_from: Only the resources modified since this datetime
+    :param mtime_to: Only the resources modified before this datetime
+    :return: The query
+    """
+    query = AndQuery()
+    if class_id:
+        query.append(PhraseQuery('base_classes', class_id))
+    if base_abspath:
+        query.append(get_base_path_query(base_abspath, min_depth=0))
+    if mtime_from or mtime_to:
+        query.append(RangeQuery('mtime', mtime_from, mtime_to))
+    if not query.atoms:
+        return AllQuery()
+    return query
+
+
 ###########################################################################
 # UUID
 ###########################################################################
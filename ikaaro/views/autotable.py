@@ -72,6 +72,12 @@ class AutoTable(Folder_BrowseContent):
     batch_start_key = 'batch_start'
     batch_size_key = 'batch_size'
 
+    @proto_property
+    def batch_keyset(self):
+        # The cursor is not prefixed, it would move every table of the
+        # CompositeView
+        return not self.prefix
+
     # Query_schema
     query_schema = merge_dicts(
         Folder_BrowseContent.query_schema,
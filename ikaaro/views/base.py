@@ -37,7 +37,7 @@ from itools.xml import XMLParser
 # Import from ikaaro
 from ikaaro.autoform import AutoForm
 from ikaaro.buttons import Button
-from ikaaro.utils import CMSTemplate
+from ikaaro.utils import CMSTemplate, get_estimated_total, get_keyset_page
 
 log = getLogger("ikaaro.web")
 
@@ -219,11 +219,18 @@ class Batch(CMSTemplate):
     """
     Input parameters:
     - total
+    - estimate (optional): whether the total is an estimation
+    - cursors (optional): the cursors of the previous and next pages, for
+      the keyset pagination
     """
 
     template = '/ui/ikaaro/generic/browse_batch.xml'
     batch_msg1 = MSG(u"There is 1 item.") # FIXME Use plural forms
     batch_msg2 = MSG(u"There are {n} items.")
+    batch_msg3 = MSG(u"There are about {n} items.")
+
+    estimate = False
+    cursors = None
 
 
     @proto_lazy_property
@@ -243,6 +250,8 @@ class Batch(CMSTemplate):
         if total == 1:
             return self.batch_msg1.gettext()
         # Plural
+        if self.estimate:
+            return self.batch_msg3.gettext(n=total)
         return self.batch_msg2.gettext(n=total)
 
 
@@ -274,11 +283,23 @@ class Batch(CMSTemplate):
 
     @proto_property
     def control(self):
+        cursors = self.cursors
+        if cursors is not None:
+            return bool(cursors['previous'] or cursors['next'])
         return self.nb_pages > 1
 
 
+    def get_cursor_uri(self, cursor):
+        if cursor is None:
+            return None
+        return self.context.uri.replace(batch_cursor=cursor, batch_start=None)
+
+
     @proto_property
     def previous(self):
+        if self.cursors is not None:
+            return self.get_cursor_uri(self.cursors['previous'])
+
         if self.current_page != 1:
             previous = max(self.start - self.size, 0)
             return self.context.uri.replace(batch_start=previous)
@@ -288,6 +309,9 @@ class Batch(CMSTemplate):
 
     @proto_property
     def next(self):
+        if self.cursors is not None:
+            return self.get_cursor_uri(self.cursors['next'])
+
         if self.current_page < self.nb_pages:
             next = self.start + self.size
             return self.context.uri.replace(batch_start=next)
@@ -297,6 +321,10 @@ class Batch(CMSTemplate):
 
     @proto_property
     def pages(self):
+        # Keyset pagination, there are no page numbers
+        if self.cursors is not None:
+            return []
+
         # Add middle pages
         current_page = self.current_page
         nb_pages = self.nb_pages
@@ -333,11 +361,18 @@ class BrowseForm(STLView):
     query_schema = {
         'batch_start': Integer(default=0),
         'batch_size': Integer(default=20),
+        'batch_cursor': String,
         'sort_by': String,
         'reverse': Boolean(default=False)}
 
     # Batch
     batch = Batch
+    # Keyset pagination: browse with cursors (see 'keyset_batch') instead
+    # of 'batch_start', the deep pages cost the same as the first one
+    batch_keyset = False
+    # Show an estimation of the number of items, cheaper than counting them
+    # (the items must be search results)
+    batch_estimate = False
 
     # Search configuration
     search_form_id = 'form-search'
@@ -358,7 +393,7 @@ class BrowseForm(STLView):
 
     # Keep the batch in the canonical URL
     canonical_query_parameters = (STLView.canonical_query_parameters
-                                  + ['batch_start'])
+                                  + ['batch_start', 'batch_cursor'])
 
 
     def get_query_schema(self):
@@ -372,11 +407,17 @@ class BrowseForm(STLView):
         # Batch
         items = self.get_items(resource, context)
         if self.batch is not None:
-            total = len(items)
-            batch = self.batch(context=context, total=total).render()
+            total = self.get_items_total(resource, context, items)
+        # The cursors are known once the items are sorted and batched
+        context.batch_cursors = None
+        items = self.sort_and_batch(resource, context, items)
+        if self.batch is not None:
+            estimate = self.is_batch_estimate(resource, context)
+            batch = self.batch(context=context, total=total,
+                               estimate=estimate,
+                               cursors=context.batch_cursors).render()
 
         # Content
-        items = self.sort_and_batch(resource, context, items)
         if self.table_template is not None:
             template = context.get_template(self.table_template)
             namespace = self.get_table_namespace(resource, context, items)
@@ -439,10 +480,44 @@ class BrowseForm(STLView):
         raise NotImplementedError("the 'get_items' method is not defined")
 
 
+    def is_keyset_batch(self, resource, context):
+        """Tells whether the items are browsed with the keyset pagination
+        (see 'keyset_batch').
+        """
+        return self.batch_keyset
+
+
+    def is_batch_estimate(self, resource, context):
+        # The pages by 'batch_start' need the exact total
+        if self.batch_estimate:
+            return self.is_keyset_batch(resource, context)
+        return False
+
+
+    def get_items_total(self, resource, context, items):
+        if self.is_batch_estimate(resource, context):
+            return get_estimated_total(items)
+        return len(items)
+
+
     def sort_and_batch(self, resource, context, items):
         raise NotImplementedError("the 'sort_and_batch' method is not defined")
 
 
+    def keyset_batch(self, resource, context, results, sort_by, reverse):
+        """Returns the resources of the page of the search results, with the
+        keyset pagination.  The values of the 'sort_by' field must be unique
+        (see 'get_keyset_page').
+        """
+        size = context.query['batch_size']
+        cursor = context.query['batch_cursor']
+        documents, previous, next = get_keyset_page(results, sort_by, reverse,
+                                                    size, cursor)
+        context.batch_cursors = {'previous': previous, 'next': next}
+        database = resource.database
+        return [ database.get_resource_from_brain(x) for x in documents ]
+
+
     def get_item_value(self, resource, context, item, column):
         if column == 'row_css':
             return None
@@ -482,7 +557,8 @@ class BrowseForm(STLView):
                     'sortable': False})
             else:
                 # Type: normal
-                base_href = context.uri.replace(sort_by=name, batch_start=None)
+                base_href = context.uri.replace(sort_by=name, batch_start=None,
+                                                batch_cursor=None)
                 if name == sort_by:
                     sort_up_active = reverse is False
                     sort_down_active = reverse is True
@@ -35,9 +35,10 @@ from itools.web import BaseView, STLView, get_context
 from ikaaro.buttons import PasteButton
 from ikaaro.buttons import Remove_BrowseButton, RenameButton, CopyButton, CutButton
 from ikaaro.buttons import ZipButton
+from ikaaro.database import get_context_value
 from ikaaro.datatypes import CopyCookie
 from ikaaro.exceptions import ConsistencyError
-from ikaaro.utils import generate_name, get_base_path_query
+from ikaaro.utils import generate_name, get_base_path_query, make_sortkey
 from ikaaro.widgets import SelectWidget, TextWidget
 from ikaaro import messages
 
@@ -45,6 +46,23 @@ from ikaaro import messages
 from base import IconsView, BrowseForm, ContextMenu
 
 
+def get_allowed_names(resource, context, names, action):
+    """Returns the names, of the given list, of the resources (within the
+    given one) that the user is allowed to change with the given action
+    ('remove', 'copy', 'move', ...), see 'Root.filter_allowed_to'.
+    """
+    children = []
+    for name in names:
+        child = resource.get_resource(name, soft=True)
+        if child is not None:
+            children.append((name, child))
+    allowed = context.root.filter_allowed_to(context.user, action,
+                                             [ x for name, x in children ])
+    allowed = set([ str(x.abspath) for x in allowed ])
+    return [ name for name, x in children if str(x.abspath) in allowed ]
+
+
+
 class SearchTypes_Enumerate(Enumerate):
 
     def get_options(self):
@@ -199,14 +217,8 @@ class Folder_Rename(STLView):
     def get_namespace(self, resource, context):
         ids = context.query['ids']
         # Filter names which the authenticated user is not allowed to move
-        root = context.root
-        user = context.user
         # Get paths of resources to rename
-        paths = []
-        for x in ids:
-            r_to_rename = resource.get_resource(x, soft=True)
-            if r_to_rename and root.is_allowed_to_move(user, r_to_rename):
-                paths.append(x)
+        paths = get_allowed_names(resource, context, ids, 'move')
         # Build the namespace
         paths.sort()
         paths.reverse()
@@ -294,6 +306,10 @@ class Folder_BrowseContent(BrowseForm):
     schema = {
         'ids': String(multiple=True, mandatory=True)}
 
+    # Batch
+    batch_keyset = True
+    batch_estimate = True
+
     # Search Form
     search_widgets = [
         TextWidget('text', title=MSG(u'Text')),
@@ -416,35 +432,70 @@ class Folder_BrowseContent(BrowseForm):
 
 
     def _get_key_sorted_by_user(self, field):
-        get_user_title = self.context.root.get_user_title
-        def key(item, cache={}):
+        context = self.context
+        def key(item):
             user = getattr(item, field)
-            if user in cache:
-                return cache[user]
-            if user:
-                title = get_user_title(user)
-                value = title.lower().translate(transmap)
-            else:
-                value = None
-            cache[user] = value
-            return value
+            if not user:
+                return None
+            return make_sortkey(self.get_user_title(context, user))
         return key
 
 
+    def get_user_title(self, context, username):
+        """Returns the title of the user, looked up once per request for
+        the sort keys and the table columns.
+        """
+        return get_context_value(context.database, 'user_titles', username,
+                                 context.root.get_user_title)
+
+
+    def get_class_title(self, context, format):
+        """Returns the title of the resource class, looked up once per
+        request for the sort keys and the table columns.
+        """
+        def get_class_title(format):
+            cls = context.database.get_resource_class(format)
+            return cls.class_title.gettext()
+        return get_context_value(context.database, 'class_titles', format,
+                                 get_class_title)
+
+
+    # Sort by the keys computed at index time {sort_by: (field, multilingual)}
+    # rather than by the slower 'get_key_sorted_by_*' methods, the sort
+    # happens in the catalog and only the batch is loaded
+    sort_keys = {
+        'title': ('title_sortkey', True),
+        'format': ('format_title_sortkey', True),
+        'last_author': ('last_author_title_sortkey', False),
+        'mtime': ('mtime_sortkey', False)}
+
+    def get_sort_key(self, resource, context, sort_by):
+        sort_key = self.sort_keys.get(sort_by)
+        if sort_key is None:
+            return None
+        # Unless the subclass overrides the 'get_key_sorted_by_*' method
+        name = 'get_key_sorted_by_%s' % sort_by
+        get_key = getattr(self, name, None)
+        default = getattr(Folder_BrowseContent, name, None)
+        if (getattr(get_key, 'im_func', None) is not
+                getattr(default, 'im_func', None)):
+            return None
+        name, multilingual = sort_key
+        if multilingual:
+            languages = context.root.get_value('website_languages')
+            language = context.accept_language.select_language(languages)
+            name = '%s_%s' % (name, language or languages[0])
+        return name
+
+
     def get_key_sorted_by_title(self):
         return self._get_key_sorted_by_unicode('title')
 
 
     def get_key_sorted_by_format(self):
-        database = self.context.database
-        def key(item, cache={}):
-            format = item.format
-            if format in cache:
-                return cache[format]
-            cls = database.get_resource_class(format)
-            value = cls.class_title.gettext().lower().translate(transmap)
-            cache[format] = value
-            return value
+        context = self.context
+        def key(item):
+            return make_sortkey(self.get_class_title(context, item.format))
         return key
 
 
@@ -452,6 +503,17 @@ class Folder_BrowseContent(BrowseForm):
         return self._get_key_sorted_by_user('last_author')
 
 
+    def is_keyset_batch(self, resource, context):
+        # Keyset pagination, on the keys computed by the catalog (or by the
+        # abspath), the others are not unique
+        if not self.batch_keyset:
+            return False
+        sort_by = context.query['sort_by']
+        if sort_by is None:
+            return True
+        return bool(self.get_sort_key(resource, context, sort_by))
+
+
     def sort_and_batch(self, resource, context, results):
         start = context.query['batch_start']
         size = context.query['batch_size']
@@ -459,11 +521,21 @@ class Folder_BrowseContent(BrowseForm):
         reverse = context.query['reverse']
 
         if sort_by is None:
-            get_key = None
+            sort_key = get_key = None
         else:
+            sort_key = self.get_sort_key(resource, context, sort_by)
             get_key = getattr(self, 'get_key_sorted_by_' + sort_by, None)
 
-        # Case 1: Custom but slower sort algorithm
+        if self.is_keyset_batch(resource, context):
+            return self.keyset_batch(resource, context, results,
+                                     sort_key or 'abspath', reverse)
+
+        # Case 1: Sort by a key computed by the catalog
+        if sort_key:
+            items = results.get_resources(sort_key, reverse, start, size)
+            return list(items)
+
+        # Case 2: Custom but slower sort algorithm
         if get_key:
             items = results.get_documents()
             items.sort(key=get_key(), reverse=reverse)
@@ -474,7 +546,7 @@ class Folder_BrowseContent(BrowseForm):
             database = resource.database
             return [ database.get_resource(x.abspath) for x in items ]
 
-        # Case 2: Faster Xapian sort algorithm
+        # Case 3: Faster Xapian sort algorithm
         items = results.get_resources(sort_by, reverse, start, size)
         return list(items)
 
@@ -506,7 +578,7 @@ class Folder_BrowseContent(BrowseForm):
             return resource_id, context.get_link(item)
         elif column == 'format':
             # Type
-            return item.class_title.gettext()
+            return self.get_class_title(context, item.metadata.format)
         elif column == 'mtime':
             # Last Modified
             mtime = item.get_value('mtime')
@@ -516,7 +588,7 @@ class Folder_BrowseContent(BrowseForm):
         elif column == 'last_author':
             # Last author
             author =  item.get_value('last_author')
-            return context.root.get_user_title(author) if author else None
+            return self.get_user_title(context, author) if author else None
         elif column == 'row_css':
             return None
 
@@ -534,16 +606,15 @@ class Folder_BrowseContent(BrowseForm):
         removed = []
         referenced = []
         not_removed = []
-        user = context.user
-        root = context.root
 
         # We sort and reverse ids in order to
         # remove the childs then their parents
         ids.sort()
         ids.reverse()
+        allowed = set(get_allowed_names(resource, context, ids, 'remove'))
         for name in ids:
             child = resource.get_resource(name, soft=True)
-            if child and root.is_allowed_to_remove(user, child):
+            if child and name in allowed:
                 # Remove resource
                 try:
                     resource.del_resource(name)
@@ -581,14 +652,7 @@ class Folder_BrowseContent(BrowseForm):
     def action_rename(self, resource, context, form):
         ids = form['ids']
         # Filter names which the authenticated user is not allowed to move
-        root = context.root
-        user = context.user
-        # Check if file to rename exists & user is allowed to move
-        paths = []
-        for x in ids:
-            r_to_rename = resource.get_resource(x, soft=True)
-            if r_to_rename and root.is_allowed_to_move(user, r_to_rename):
-                paths.append(x)
+        paths = get_allowed_names(resource, context, ids, 'move')
 
         # Check input data
         if not paths:
@@ -607,10 +671,7 @@ class Folder_BrowseContent(BrowseForm):
     def action_copy(self, resource, context, form):
         ids = form['ids']
         # Filter names which the authenticated user is not allowed to copy
-        root = context.root
-        user = context.user
-        names = [ x for x in ids
-                  if root.is_allowed_to_copy(user, resource.get_resource(x)) ]
+        names = get_allowed_names(resource, context, ids, 'copy')
 
         # Check input data
         if not names:
@@ -628,14 +689,7 @@ class Folder_BrowseContent(BrowseForm):
     def action_cut(self, resource, context, form):
         ids = form['ids']
         # Filter names which the authenticated user is not allowed to move
-        root = context.root
-        user = context.user
-        # Check if file to cut exists & user is allowed to move
-        names = []
-        for x in ids:
-            r_to_move = resource.get_resource(x, soft=True)
-            if r_to_move and root.is_allowed_to_move(user, r_to_move):
-                names.append(x)
+        names = get_allowed_names(resource, context, ids, 'move')
         # Check input data
         if not names:
             context.message = messages.MSG_NONE_SELECTED
@@ -0,0 +1,204 @@
+# -*- coding: UTF-8 -*-
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Streaming of the files, from the disk, with support for ranges and
+entity tags.
+"""
+
+# Import from the Standard Library
+from hashlib import sha1
+from os import stat
+from os.path import isfile
+
+# Import from itools
+from itools.datatypes import HTTPDate
+from itools.web import NotModified
+
+# Read the files by chunks of this size
+chunk_size = 65536
+
+
+class FileEntity(object):
+    """The body of a response read from a file, or from a range of it.  The
+    WSGI application streams it, so the file is never fully in memory.
+    """
+
+    def __init__(self, path, start=0, length=None):
+        self.path = path
+        self.start = start
+        if length is None:
+            length = stat(path).st_size - start
+        self.length = length
+
+
+    def __len__(self):
+        return self.length
+
+
+    def is_whole_file(self):
+        return self.start == 0 and self.length == stat(self.path).st_size
+
+
+    def __iter__(self):
+        with open(self.path, 'rb') as f:
+            f.seek(self.start)
+            left = self.length
+            while left > 0:
+                data = f.read(min(chunk_size, left))
+                if not data:
+                    break
+                left -= len(data)
+                yield data
+
+
+
+class StreamEntity(object):
+    """Base class of the bodies of the responses that are made by chunks
+    while they are sent (by iterating them).  Their length is not known, so
+    they are sent with the chunked transfer encoding.
+    """
+
+    def __iter__(self):
+        raise NotImplementedError
+
+
+
+def get_handler_path(handler):
+    """Returns the path of the file of the given handler, in the static
+    files of the database, or None if the handler has unsaved changes or
+    is not stored there.
+    """
+    database = getattr(handler, 'database', None)
+    key = handler.key
+    if database is None or not key or getattr(handler, 'dirty', None):
+        return None
+    path = '%s/database_static/%s' % (database.path, key.lstrip('/'))
+    return path if isfile(path) else None
+
+
+
+def get_file_version(path):
+    """Returns the version of the file, made of its size, its modification
+    time and its path.  The file is not read, and all the processes serving
+    it give the same version.
+    """
+    info = stat(path)
+    return '%x-%x-%s' % (info.st_size, int(info.st_mtime * 1000000),
+                         sha1(path).hexdigest()[:16])
+
+
+
+def get_file_etag(path):
+    """Returns the weak entity tag of the file, see 'get_file_version'.
+    """
+    return 'W/"%s"' % get_file_version(path)
+
+
+
+def parse_range(value, size):
+    """Returns the (start, length) of the single byte range of the given
+    Range header value, None if it is not supported (then the whole file
+    is sent).  Raises ValueError if the range cannot be satisfied.
+    """
+    unit, sep, ranges = value.partition('=')
+    if unit.strip() != 'bytes' or not sep or ',' in ranges:
+        return None
+    first, sep, last = ranges.strip().partition('-')
+    if not sep:
+        return None
+    try:
+        if first:
+            start = int(first)
+            end = int(last) if last else size - 1
+        elif last:
+            # The last bytes
+            start = max(size - int(last), 0)
+            end = size - 1
+        else:
+            return None
+    except ValueError:
+        return None
+    if start >= size:
+        raise ValueError('range not satisfiable')
+    if start > end:
+        return None
+    return start, min(end, size - 1) - start + 1
+
+
+
+def strip_weak(etag):
+    return etag[2:] if etag.startswith('W/') else etag
+
+
+
+def check_etag(context, etag):
+    """Sets the 'ETag' header, raises NotModified if the client has this
+    version already (the weak comparison is used).
+    """
+    context.set_header('ETag', etag)
+    if_none_match = context.get_header('if-none-match')
+    if if_none_match:
+        etags = [ strip_weak(x.strip()) for x in if_none_match.split(',') ]
+        if strip_weak(etag) in etags or '*' in etags:
+            raise NotModified
+
+
+
+def check_if_range(context, if_range):
+    """Returns True if the range of the request applies to the current
+    version of the file.  The entity tags of the files are weak, they
+    cannot validate a range: only the date of the last modification does.
+    """
+    if not if_range:
+        return True
+    if if_range.startswith('"') or if_range.startswith('W/'):
+        return False
+    if context.mtime is None:
+        return False
+    try:
+        return HTTPDate.decode(if_range) == context.mtime
+    except ValueError:
+        return False
+
+
+
+def get_file_response(context, path):
+    """Returns the entity to send the given file, with the 'ETag' and
+    'Accept-Ranges' headers.  Answers 304 if the client has the file
+    already, and 206 for a range request.
+    """
+    etag = get_file_etag(path)
+    context.set_header('Accept-Ranges', 'bytes')
+    # Not modified
+    check_etag(context, etag)
+
+    # Range
+    size = stat(path).st_size
+    value = context.get_header('range')
+    if value and check_if_range(context, context.get_header('if-range')):
+        try:
+            byte_range = parse_range(value, size)
+        except ValueError:
+            context.status = 416
+            context.set_header('Content-Range', 'bytes */%s' % size)
+            return ''
+        if byte_range is not None:
+            start, length = byte_range
+            context.status = 206
+            context.set_header('Content-Range', 'bytes %s-%s/%s'
+                               % (start, start + length - 1, size))
+            return FileEntity(path, start, length)
+
+    return FileEntity(path, 0, size)
@@ -0,0 +1,208 @@
+# -*- coding: UTF-8 -*-
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Incremental parsing of the multipart request bodies.  The body is read by
+chunks, the uploaded files are spooled to temporary files above a size
+threshold, so the request body is never fully in memory.
+"""
+
+# Import from the Standard Library
+from cStringIO import StringIO
+from tempfile import SpooledTemporaryFile
+
+# Import from itools
+from itools.web.entities import read_headers
+from itools.web.exceptions import ClientError
+
+# Read the request body by chunks of this size
+chunk_size = 65536
+# The uploaded files bigger than this are spooled to the disk
+spool_size = 1048576
+# The headers of a part cannot be bigger than this
+max_headers_size = 65536
+
+
+class RequestEntityTooLarge(ClientError):
+    code = 413
+    title = 'Request Entity Too Large'
+
+
+
+def check_body_size(length, max_size):
+    """Raises RequestEntityTooLarge if the given length of a request body is
+    over the maximum size (no limit if the maximum size is zero).
+    """
+    if max_size and length > max_size:
+        raise RequestEntityTooLarge
+
+
+
+class MultipartParser(object):
+    """Parses a "multipart/form-data" body read from the given input, where
+    the body is 'length' bytes long.
+    """
+
+    def __init__(self, input, boundary, length):
+        self.input = input
+        self.left = length
+        self.delimiter = '\r\n--%s' % boundary
+        # The body starts with a delimiter, without the leading CRLF
+        self.buffer = '\r\n'
+
+
+    def fill(self):
+        """Reads the next chunk of the body into the buffer.  Returns False
+        if the body is over.
+        """
+        if self.left <= 0:
+            return False
+        data = self.input.read(min(chunk_size, self.left))
+        if not data:
+            self.left = 0
+            return False
+        self.left -= len(data)
+        self.buffer += data
+        return True
+
+
+    def read_until_delimiter(self, write=None):
+        """Passes the data up to the next delimiter to the given 'write'
+        function (or skips it).  Returns False if the body is truncated.
+        """
+        delimiter = self.delimiter
+        keep = len(delimiter) - 1
+        while True:
+            index = self.buffer.find(delimiter)
+            if index >= 0:
+                if write is not None:
+                    write(self.buffer[:index])
+                self.buffer = self.buffer[index + len(delimiter):]
+                return True
+            # The end of the buffer may be the start of the delimiter
+            if len(self.buffer) > keep:
+                if write is not None:
+                    write(self.buffer[:-keep])
+                self.buffer = self.buffer[-keep:]
+            if not self.fill():
+                return False
+
+
+    def read_headers(self):
+        """Returns the headers of the next part, or None if the body is over
+        or truncated.
+        """
+        # The delimiter is followed by '--' for the last one
+        while len(self.buffer) < 2 and self.fill():
+            pass
+        if self.buffer[:2] == '--':
+            return None
+        # The headers end with an empty line
+        index = self.buffer.find('\r\n\r\n')
+        while index < 0:
+            if len(self.buffer) > max_headers_size:
+                raise ValueError('multipart headers too long')
+            if not self.fill():
+                return None
+            index = self.buffer.find('\r\n\r\n')
+        data = self.buffer[:index]
+        self.buffer = self.buffer[index + 4:]
+        if not data.strip():
+            return {}
+        return read_headers(StringIO(data))
+
+
+    def get_parts(self):
+        """Yields the (headers, file) of the parts of the body, the file is
+        rewound.  It is a temporary file, spooled to the disk if it is big.
+        """
+        # Skip the preamble
+        if not self.read_until_delimiter():
+            return
+        while True:
+            headers = self.read_headers()
+            if headers is None:
+                return
+            file = SpooledTemporaryFile(spool_size)
+            if not self.read_until_delimiter(file.write):
+                file.close()
+                return
+            file.seek(0)
+            yield headers, file
+
+
+
+def parse_multipart(input, boundary, length):
+    """Returns the form of the given multipart body: the value of a file
+    input is a tuple (filename, mimetype, file), where the file is the
+    temporary file the upload was spooled to (see 'read_file_body').
+    """
+    form = {}
+    for headers, file in MultipartParser(input, boundary, length).get_parts():
+        # Find out the parameter name
+        header = headers.get('content-disposition')
+        if header is None:
+            file.close()
+            continue
+        value, header_parameters = header
+        name = header_parameters['name']
+        if 'filename' in header_parameters:
+            filename = header_parameters['filename']
+            if filename:
+                # Strip the path (for IE).
+                filename = filename.split('\\')[-1]
+                # Default content-type, see
+                # http://tools.ietf.org/html/rfc2045#section-5.2
+                if 'content-type' in headers:
+                    mimetype = headers['content-type'][0]
+                else:
+                    mimetype = 'text/plain'
+                # The file is kept, it is not read in memory
+                form[name] = filename, mimetype, file
+            else:
+                file.close()
+                form[name] = None
+        else:
+            # Load the value
+            try:
+                body = file.read()
+            finally:
+                file.close()
+            if name not in form:
+                form[name] = body
+            else:
+                if isinstance(form[name], list):
+                    form[name].append(body)
+                else:
+                    form[name] = [form[name], body]
+    return form
+
+
+
+def is_file_body(body):
+    """Returns whether the given body of a file input is a file (see
+    'parse_multipart'), rather than a byte string.
+    """
+    return isinstance(body, (file, SpooledTemporaryFile))
+
+
+
+def read_file_body(body):
+    """Returns the data of the given body of a file input, a file (see
+    'parse_multipart') or a byte string.
+    """
+    if not is_file_body(body):
+        return body
+    body.seek(0)
+    return body.read()
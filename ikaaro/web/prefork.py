@@ -0,0 +1,381 @@
+# -*- coding: UTF-8 -*-
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Pre-fork worker mode.
+
+The master process binds the listening socket and forks the workers, they
+all accept connections from the inherited socket.  Only one of them, the
+writer, opens the database in read-write mode.  The other workers open it
+read-only and forward the requests that may write (POST, PUT, DELETE...)
+to the writer, through a private unix socket.
+"""
+
+# Import from the Standard Library
+from errno import ECHILD, ECONNREFUSED, EINTR, ENOENT
+from httplib import HTTPConnection
+from logging import getLogger
+from os import _exit, fork, kill, remove, waitpid
+from signal import signal, SIGHUP, SIGINT, SIGTERM, SIG_DFL
+from socket import socket as std_socket
+from socket import AF_INET, AF_UNIX, SOCK_STREAM, SOL_SOCKET, SO_REUSEADDR
+from socket import error
+from urllib import quote
+
+# Import from gevent
+from gevent import reinit, sleep
+from gevent.socket import socket
+
+# Import from ikaaro
+from multipart import check_body_size, chunk_size, RequestEntityTooLarge
+from wsgi import READ_ONLY_METHODS
+
+log = getLogger("ikaaro")
+
+# Connect to the writer this number of times (within about 6 seconds)
+connect_retries = 8
+
+# Headers that only make sense for a single connection
+hop_by_hop = ('connection', 'keep-alive', 'transfer-encoding', 'upgrade',
+              'proxy-authenticate', 'proxy-authorization', 'te', 'trailers')
+
+
+def make_listener(address, backlog=1024):
+    """Returns a non blocking listening socket. The given address is a
+    (host, port) tuple or, for an unix socket, a path.
+    """
+    if type(address) is tuple:
+        sock = std_socket(AF_INET, SOCK_STREAM)
+        sock.setsockopt(SOL_SOCKET, SO_REUSEADDR, 1)
+    else:
+        sock = std_socket(AF_UNIX, SOCK_STREAM)
+        try:
+            remove(address)
+        except OSError:
+            pass
+    sock.bind(address)
+    sock.listen(backlog)
+    sock.setblocking(0)
+    return sock
+
+
+
+###########################################################################
+# Forward writes to the writer
+###########################################################################
+class UnixHTTPConnection(HTTPConnection):
+
+    def __init__(self, path, timeout=None):
+        HTTPConnection.__init__(self, 'localhost', timeout=timeout)
+        self.unix_path = path
+
+
+    def connect(self):
+        # The writer may be restarting, try again a few times
+        delay = 0.05
+        for i in range(connect_retries):
+            sock = socket(AF_UNIX, SOCK_STREAM)
+            try:
+                sock.connect(self.unix_path)
+            except error as e:
+                sock.close()
+                if e.errno not in (ECONNREFUSED, ENOENT):
+                    raise
+                if i == connect_retries - 1:
+                    raise
+                sleep(delay)
+                delay *= 2
+            else:
+                break
+        self.sock = sock
+
+
+
+def get_request_headers(environ):
+    headers = {}
+    for key, value in environ.items():
+        if key.startswith('HTTP_'):
+            name = key[5:].replace('_', '-').title()
+            headers[name] = value
+    if environ.get('CONTENT_TYPE'):
+        headers['Content-Type'] = environ['CONTENT_TYPE']
+    if environ.get('CONTENT_LENGTH'):
+        headers['Content-Length'] = str(environ['CONTENT_LENGTH'])
+    for name in headers.keys():
+        if name.lower() in hop_by_hop:
+            del headers[name]
+    # The writer does not see the client (see 'trust_forwarded')
+    if 'Host' not in headers:
+        host = environ.get('SERVER_NAME', 'localhost')
+        port = environ.get('SERVER_PORT')
+        if port and port not in ('80', '443'):
+            host = '%s:%s' % (host, port)
+        headers['Host'] = host
+    remote_addr = environ.get('REMOTE_ADDR') or '127.0.0.1'
+    forwarded_for = headers.get('X-Forwarded-For')
+    if forwarded_for:
+        remote_addr = '%s, %s' % (forwarded_for, remote_addr)
+    headers['X-Forwarded-For'] = remote_addr
+    if 'X-Forwarded-Proto' not in headers:
+        headers['X-Forwarded-Proto'] = environ.get('wsgi.url_scheme', 'http')
+    return headers
+
+
+
+def get_response_headers(response):
+    # Do not use 'getheaders', it merges the Set-Cookie headers
+    headers = []
+    for line in response.msg.headers:
+        if line[0] in ' \t' and headers:
+            name, value = headers.pop()
+            headers.append((name, value + ' ' + line.strip()))
+            continue
+        name, value = line.split(':', 1)
+        if name.lower() in hop_by_hop:
+            continue
+        headers.append((name, value.strip()))
+    return headers
+
+
+
+def read_response(connection, response, size=65536):
+    """Yields the body of the given response by chunks, then closes the
+    connection.
+    """
+    try:
+        while True:
+            data = response.read(size)
+            if not data:
+                break
+            yield data
+    finally:
+        connection.close()
+
+
+
+def send_chunked(connection, method, path, headers, input, max_size=0):
+    """Sends the request with the body read from the given input, without
+    knowing its length: it is sent with the chunked transfer encoding.
+    Raises RequestEntityTooLarge if the body is over the maximum size.
+    """
+    connection.putrequest(method, path, skip_host=True,
+                          skip_accept_encoding=True)
+    for name, value in headers.items():
+        connection.putheader(name, value)
+    connection.putheader('Transfer-Encoding', 'chunked')
+    connection.endheaders()
+    size = 0
+    while True:
+        data = input.read(chunk_size)
+        if not data:
+            break
+        size += len(data)
+        check_body_size(size, max_size)
+        connection.send('%x\r\n%s\r\n' % (len(data), data))
+    connection.send('0\r\n\r\n')
+
+
+
+def forward_writes(application, writer_path, max_upload_size=0):
+    """Wraps the given WSGI application, the requests that may write to the
+    database are forwarded to the writer.  The request body is streamed to
+    the writer.
+    """
+    def too_large(e, start_response):
+        status = '%s %s' % (e.code, e.title)
+        start_response(status, [('Content-Type', 'text/plain')])
+        return [status]
+
+    def forward(environ, start_response):
+        if environ.get('REQUEST_METHOD') in READ_ONLY_METHODS:
+            return application(environ, start_response)
+        length = int(environ.get('CONTENT_LENGTH') or 0)
+        try:
+            check_body_size(length, max_upload_size)
+        except RequestEntityTooLarge as e:
+            return too_large(e, start_response)
+        # Build the request
+        method = environ['REQUEST_METHOD']
+        path = quote(environ.get('PATH_INFO') or '/')
+        query = environ.get('QUERY_STRING')
+        if query:
+            path = '%s?%s' % (path, query)
+        headers = get_request_headers(environ)
+        encoding = environ.get('HTTP_TRANSFER_ENCODING', '')
+        chunked = 'chunked' in encoding.lower()
+        # Send it to the writer
+        connection = UnixHTTPConnection(writer_path)
+        try:
+            if chunked:
+                send_chunked(connection, method, path, headers,
+                             environ['wsgi.input'], max_upload_size)
+            else:
+                body = environ['wsgi.input'] if length else None
+                connection.request(method, path, body, headers)
+            response = connection.getresponse()
+        except RequestEntityTooLarge as e:
+            connection.close()
+            return too_large(e, start_response)
+        except Exception:
+            connection.close()
+            raise
+        # Response (streamed)
+        status = '%s %s' % (response.status, response.reason)
+        start_response(status, get_response_headers(response))
+        return read_response(connection, response)
+
+    return forward
+
+
+
+def trust_forwarded(application):
+    """Wraps the application of the writer on the private unix socket: the
+    address and the scheme of the client are the ones sent by the read-only
+    worker (see 'get_request_headers').  Do not use it on a public socket,
+    the headers would be trusted from anybody.
+    """
+    def trusted(environ, start_response):
+        forwarded_for = environ.get('HTTP_X_FORWARDED_FOR')
+        if forwarded_for:
+            # The last address is the one added by the worker
+            environ['REMOTE_ADDR'] = forwarded_for.split(',')[-1].strip()
+        forwarded_proto = environ.get('HTTP_X_FORWARDED_PROTO')
+        if forwarded_proto in ('http', 'https'):
+            environ['wsgi.url_scheme'] = forwarded_proto
+        return application(environ, start_response)
+
+    return trusted
+
+
+
+###########################################################################
+# The master process
+###########################################################################
+class Arbiter(object):
+    """Forks and supervises the workers: a worker that dies is restarted,
+    SIGHUP restarts them gracefully one by one, SIGTERM and SIGINT stop them.
+    """
+
+    def __init__(self, server, address, port, workers):
+        self.server = server
+        self.address = address
+        self.port = port
+        self.n_workers = workers
+        self.workers = {} # slot -> pid
+        self.listener = None
+        self.stopping = False
+        self.reloading = False
+
+
+    def run(self):
+        server = self.server
+        log.info("Pre-fork mode with {} workers".format(self.n_workers))
+        # The master process does not use the database
+        server.database.close()
+        # Listen
+        address = '' if self.address == '*' else self.address
+        self.listener = make_listener((address, self.port))
+        signal(SIGTERM, self.stop_signal)
+        signal(SIGINT, self.stop_signal)
+        signal(SIGHUP, self.reload_signal)
+        # Fork the workers (slot 0 is the writer)
+        for slot in range(self.n_workers):
+            self.spawn(slot)
+        # Supervise
+        while self.workers:
+            if self.reloading:
+                self.reload()
+            pid = self.wait()
+            if pid is None:
+                continue
+            slot = self.get_slot(pid)
+            if slot is None:
+                continue
+            del self.workers[slot]
+            if not self.stopping:
+                log.warning("Worker {} ({}) died, restart it".format(slot, pid))
+                self.spawn(slot)
+        # Ok
+        self.listener.close()
+        try:
+            remove(server.get_writer_path())
+        except OSError:
+            pass
+
+
+    def spawn(self, slot):
+        pid = fork()
+        if pid:
+            self.workers[slot] = pid
+            return pid
+
+        # Worker process
+        status = 0
+        try:
+            reinit()
+            for signum in (SIGTERM, SIGINT, SIGHUP):
+                signal(signum, SIG_DFL)
+            self.server.run_worker(self.listener, is_writer=(slot == 0))
+        except Exception:
+            log.error("Worker {} failed".format(slot), exc_info=True)
+            status = 1
+        finally:
+            _exit(status)
+
+
+    def wait(self, pid=-1):
+        try:
+            pid, status = waitpid(pid, 0)
+        except OSError as e:
+            if e.errno == EINTR:
+                return None
+            if e.errno == ECHILD:
+                self.workers.clear()
+                return None
+            raise
+        return pid
+
+
+    def get_slot(self, pid):
+        for slot, worker_pid in self.workers.items():
+            if worker_pid == pid:
+                return slot
+        return None
+
+
+    def reload(self):
+        self.reloading = False
+        log.info("Reload the workers")
+        # The writer (slot 0) last, the writes are forwarded to it
+        for slot, pid in sorted(self.workers.items(), reverse=True):
+            # Wait for the worker to finish its pending requests
+            kill(pid, SIGTERM)
+            while self.wait(pid) is None:
+                if self.stopping or slot not in self.workers:
+                    return
+            del self.workers[slot]
+            self.spawn(slot)
+
+
+    def stop_signal(self, signum, frame):
+        self.stopping = True
+        for pid in self.workers.values():
+            try:
+                kill(pid, SIGTERM)
+            except OSError:
+                pass
+
+
+    def reload_signal(self, signum, frame):
+        self.reloading = True
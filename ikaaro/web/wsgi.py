@@ -16,6 +16,7 @@
 
 # Import from standard library
 import traceback
+from copy import copy
 from logging import getLogger
 from time import time
 import os
@@ -34,17 +35,58 @@ from ikaaro.constants import SESSION_EXPIRE, SESSION_TIMEOUT
 from ikaaro.constants import SESSION_DOMAIN, SESSION_SAMESITE
 from ikaaro.constants import SESSION_KEY
 from ikaaro.server import get_server
+from ikaaro.web.files import FileEntity, StreamEntity, chunk_size
+from ikaaro.web.multipart import RequestEntityTooLarge
 
 log = getLogger("ikaaro.web")
 
+# Requests with these methods never write to the database
+READ_ONLY_METHODS = ('GET', 'HEAD', 'OPTIONS')
 
-def application(environ, start_response):
-    t0 = time()
+
+def is_read_only_request(environ):
+    """Read-only requests share the database lock and run concurrently,
+    the others are serialized.
+    """
+    server = get_server()
+    if not server.concurrent_reads:
+        return False
+    return environ.get('REQUEST_METHOD') in READ_ONLY_METHODS
+
+
+def is_read_only_view(context):
+    """The views that write to the database on a read-only method (GET...)
+    say it with the 'read_only = False' class variable.
+    """
+    try:
+        response = context.server.dispatcher.resolve(str(context.path))
+        if response:
+            view = response[0]
+        else:
+            path = copy(context.path)
+            path.startswith_slash = False
+            resource = context.site_root.get_resource(path, soft=True)
+            if resource is None:
+                return True
+            view = resource.get_view(context.view_name, context.uri.query)
+    except Exception:
+        # The request will fail, the error is reported by 'handle_request'
+        return True
+    return getattr(view, 'read_only', True) is not False
+
+
+def handle_request(environ, t0, read_only):
+    """Handles the request within a context, returns the context, or None
+    if the view may write while the context is read-only.
+    """
     server = get_server()
-    with server.database.init_context(commit_at_exit=False) as context:
+    with server.database.init_context(commit_at_exit=False,
+                                      read_only=read_only) as context:
         try:
             # Init context from wsgi envrion
             context.init_from_environ(environ)
+            if read_only and not is_read_only_view(context):
+                return None
             # Handle the request
             RequestMethod.handle_request(context)
             t1 = time()
@@ -52,22 +94,51 @@ def application(environ, start_response):
             context.request_time = t1-t0
             # Callback at end of request
             context.on_request_end()
+        except RequestEntityTooLarge as e:
+            # The body is refused before the context is fully initialized
+            context.set_default_response(e.code)
         except HTTPError as e:
             RequestMethod.handle_client_error(e, context)
         except StandardError as e:
             tb = traceback.format_exc()
             log.error("Internal error : {}".format(tb), exc_info=True)
             context.set_default_response(500)
-        finally:
-            headers = context.header_response
-            if context.content_type:
-                headers.append(('Content-Type', context.content_type))
-            if context.entity and not isinstance(context.entity, Reference):
-                headers.append(('Content-Length', str(len(context.entity))))
-            status = context.status or 500
-            status = '{0} {1}'.format(status, reason_phrases[status])
-            start_response(str(status), headers)
-            yield context.entity
+    return context
+
+
+def application(environ, start_response):
+    t0 = time()
+    read_only = is_read_only_request(environ)
+    context = handle_request(environ, t0, read_only)
+    if context is None:
+        # Serialized like the other requests that write
+        context = handle_request(environ, t0, False)
+    # Group commit: answer once the changes are flushed to the catalog
+    if context.catalog_flush:
+        try:
+            context.catalog_flush.get()
+        except Exception:
+            context.set_default_response(500)
+    # Response
+    entity = context.entity
+    headers = context.header_response
+    if context.content_type:
+        headers.append(('Content-Type', context.content_type))
+    if entity and not isinstance(entity, (Reference, StreamEntity)):
+        headers.append(('Content-Length', str(len(entity))))
+    status = context.status or 500
+    status = '{0} {1}'.format(status, reason_phrases[status])
+    start_response(str(status), headers)
+    # Files are streamed, with sendfile if the server supports it
+    if isinstance(entity, FileEntity):
+        file_wrapper = environ.get('wsgi.file_wrapper')
+        if file_wrapper and entity.is_whole_file():
+            return file_wrapper(open(entity.path, 'rb'), chunk_size)
+        return entity
+    # Made while sent
+    if isinstance(entity, StreamEntity):
+        return entity
+    return [entity]
 
 
 try:
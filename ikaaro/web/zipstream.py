@@ -0,0 +1,204 @@
+# -*- coding: UTF-8 -*-
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""ZIP archives written as a stream: the archive is made by chunks while it
+is sent, so it is never fully in memory and it does not need a seekable
+file.  The sizes and CRC of every file follow its data (data descriptor),
+and the ZIP64 extensions are used for the big files and archives.
+"""
+
+# Import from the Standard Library
+from datetime import datetime
+from struct import pack
+from zlib import compressobj, crc32, DEFLATED, MAX_WBITS
+from zlib import Z_DEFAULT_COMPRESSION
+
+# Import from ikaaro
+from ikaaro.web.files import FileEntity, StreamEntity
+
+# Compression methods
+ZIP_STORED = 0
+ZIP_DEFLATED = 8
+
+# Beyond these limits the ZIP64 extensions are used
+ZIP64_LIMIT = (1 << 31) - 1
+ZIP_MAX_COUNT = 0xFFFF
+
+# The data already compressed is stored
+stored_mimetypes = ('image/jpeg', 'image/png', 'image/gif', 'application/zip',
+                    'application/x-gzip', 'application/x-bzip2')
+
+
+def get_compress_type(mimetype):
+    """Returns the compression method for the files of the given type.
+    """
+    if mimetype in stored_mimetypes:
+        return ZIP_STORED
+    if mimetype.startswith('video/') or mimetype.startswith('audio/'):
+        return ZIP_STORED
+    return ZIP_DEFLATED
+
+
+
+def get_dostime(mtime):
+    if mtime is None:
+        mtime = datetime.now()
+    date = (mtime.year - 1980) << 9 | mtime.month << 5 | mtime.day
+    time = mtime.hour << 11 | mtime.minute << 5 | mtime.second // 2
+    return time, date
+
+
+
+class ZipStream(StreamEntity):
+    """The body of a response that is a ZIP archive, made while it is sent.
+    The files are added with 'add_file' (from the disk) or 'add_data' (from
+    memory) before the archive is sent.  It has no length, so it is sent
+    with the chunked transfer encoding.
+    """
+
+    def __init__(self):
+        self.entries = []
+
+
+    def add_file(self, name, path, mtime=None, compress_type=ZIP_DEFLATED):
+        self.entries.append((name, path, None, mtime, compress_type))
+
+
+    def add_data(self, name, data, mtime=None, compress_type=ZIP_DEFLATED):
+        self.entries.append((name, None, data, mtime, compress_type))
+
+
+    def __iter__(self):
+        offset = 0
+        central_directory = []
+        for name, path, data, mtime, compress_type in self.entries:
+            if type(name) is unicode:
+                name = name.encode('utf-8')
+            if path is not None:
+                entity = FileEntity(path)
+                size = len(entity)
+            else:
+                entity = [data]
+                size = len(data)
+            zip64 = size > ZIP64_LIMIT
+            dostime = get_dostime(mtime)
+
+            # Local file header (the sizes and CRC follow the data)
+            header = self.get_local_header(name, dostime, compress_type, zip64)
+            yield header
+            header_offset = offset
+            offset += len(header)
+
+            # Data
+            crc = 0
+            compressed_size = 0
+            file_size = 0
+            if compress_type == ZIP_DEFLATED:
+                compressor = compressobj(Z_DEFAULT_COMPRESSION, DEFLATED,
+                                         -MAX_WBITS)
+            for chunk in entity:
+                crc = crc32(chunk, crc)
+                file_size += len(chunk)
+                if compress_type == ZIP_DEFLATED:
+                    chunk = compressor.compress(chunk)
+                    if not chunk:
+                        continue
+                compressed_size += len(chunk)
+                yield chunk
+            if compress_type == ZIP_DEFLATED:
+                chunk = compressor.flush()
+                compressed_size += len(chunk)
+                yield chunk
+            crc = crc & 0xFFFFFFFF
+
+            # Data descriptor
+            if zip64:
+                fmt = '<LLQQ'
+            else:
+                fmt = '<LLLL'
+            descriptor = pack(fmt, 0x08074b50, crc, compressed_size,
+                              file_size)
+            yield descriptor
+            offset += compressed_size + len(descriptor)
+            central_directory.append(
+                (name, dostime, compress_type, crc, compressed_size,
+                 file_size, header_offset))
+
+        # Central directory
+        start = offset
+        for entry in central_directory:
+            data = self.get_central_header(*entry)
+            offset += len(data)
+            yield data
+        yield self.get_end_record(len(central_directory), start, offset)
+
+
+    def get_local_header(self, name, dostime, compress_type, zip64):
+        time, date = dostime
+        if zip64:
+            # The sizes are in the data descriptor
+            extra = pack('<HHQQ', 1, 16, 0, 0)
+            version = 45
+            size = 0xFFFFFFFF
+        else:
+            extra = ''
+            version = 20
+            size = 0
+        return pack('<LHHHHHLLLHH', 0x04034b50, version, 0x08, compress_type,
+                    time, date, 0, size, size, len(name),
+                    len(extra)) + name + extra
+
+
+    def get_central_header(self, name, dostime, compress_type, crc,
+                           compressed_size, file_size, header_offset):
+        time, date = dostime
+        # The values too big for the header are in the ZIP64 extra field
+        extra = []
+        if file_size > ZIP64_LIMIT:
+            extra.append(file_size)
+            file_size = 0xFFFFFFFF
+        if compressed_size > ZIP64_LIMIT:
+            extra.append(compressed_size)
+            compressed_size = 0xFFFFFFFF
+        if header_offset > ZIP64_LIMIT:
+            extra.append(header_offset)
+            header_offset = 0xFFFFFFFF
+        if extra:
+            extra = pack('<HH' + 'Q' * len(extra), 1, 8 * len(extra), *extra)
+            version = 45
+        else:
+            extra = ''
+            version = 20
+        # The files are readable by all (-rw-r--r--)
+        attributes = 0100644 << 16
+        return pack('<LHHHHHHLLLHHHHHLL', 0x02014b50, version, version, 0x08,
+                    compress_type, time, date, crc, compressed_size,
+                    file_size, len(name), len(extra), 0, 0, 0, attributes,
+                    header_offset) + name + extra
+
+
+    def get_end_record(self, count, start, end):
+        size = end - start
+        record = ''
+        if count > ZIP_MAX_COUNT or start > ZIP64_LIMIT or size > ZIP64_LIMIT:
+            # ZIP64 end of central directory record, and its locator
+            record = pack('<LQHHLLQQQQ', 0x06064b50, 44, 45, 45, 0, 0,
+                          count, count, size, start)
+            record += pack('<LLQL', 0x07064b50, 0, end, 1)
+            count = min(count, ZIP_MAX_COUNT)
+            size = min(size, 0xFFFFFFFF)
+            start = min(start, 0xFFFFFFFF)
+        return record + pack('<LHHHHLLH', 0x06054b50, 0, 0, count, count,
+                             size, start, 0)
@@ -27,6 +27,7 @@ from autoadd import AutoAdd
 from database import Database
 from fields import HTMLFile_Field
 from file import File
+from fulltext import handler_to_text
 
 
 
@@ -75,7 +76,7 @@ class WebPage(File):
         for language in languages:
             handler = self.get_value('data', language=language)
             if handler:
-                result[language] = handler.to_text()
+                result[language] = handler_to_text(handler)
         return result
 
 
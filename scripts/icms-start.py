@@ -48,6 +48,10 @@ if __name__ == '__main__':
     parser.add_option(
         '-p', '--port', default=None,
         help="Start the server on this port")
+    parser.add_option(
+        '-w', '--workers', default=None,
+        help="Fork this number of worker processes (overrides the 'workers'"
+             " option of config.conf)")
     parser.add_option(
         '--quick', action="store_true", default=False,
         help="Do not check the database consistency.")
@@ -69,7 +73,7 @@ if __name__ == '__main__':
     try:
         server = Server(target, read_only=options.read_only,
                         profile_space=options.profile_space,
-                        port=options.port)
+                        port=options.port, workers=options.workers)
     except LookupError:
         log.error("Error: {} instance do not exists".format(target))
         exit(1)
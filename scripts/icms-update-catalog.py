@@ -24,6 +24,7 @@ from xapian import DatabaseLockError
 
 # Import from itools
 import itools
+from itools.datatypes import DateTime
 
 # Import from ikaaro
 from ikaaro.server import Server, ask_confirmation
@@ -46,11 +47,23 @@ def update_catalog(parser, options, target):
     if ask_confirmation(message, options.confirm) is False:
         return
 
+    # Only reindex the selected resources
+    if options.class_id or options.path or options.since or options.until:
+        server.reindex_resources(
+            class_id=options.class_id,
+            base_abspath=options.path,
+            mtime_from=DateTime.decode(options.since) if options.since else None,
+            mtime_to=DateTime.decode(options.until) if options.until else None,
+            batch_size=options.batch_size)
+        return
+
     # Server reindex
     server.reindex_catalog(
         as_test=options.test,
         quiet=options.quiet,
-        quick=options.quick)
+        quick=options.quick,
+        jobs=options.jobs,
+        resume=options.resume)
 
 
 
@@ -76,6 +89,25 @@ if __name__ == '__main__':
         help="do not check the database consistency.")
     parser.add_option('-t', '--test', action='store_true', default=False,
         help="a test mode, don't stop the indexation when an error occurs")
+    parser.add_option('-j', '--jobs', type='int', default=1,
+        help="compute the documents to index in JOBS parallel processes"
+             " (default 1)")
+    parser.add_option('--resume', action='store_true', default=False,
+        help="continue an interrupted update from its last checkpoint")
+    parser.add_option('--class-id',
+        help="only reindex, in place, the resources of this class (or of a"
+             " class that inherits from it)")
+    parser.add_option('--path',
+        help="only reindex, in place, the resources within this path")
+    parser.add_option('--since',
+        help="only reindex, in place, the resources modified since this"
+             " date (ISO 8601)")
+    parser.add_option('--until',
+        help="only reindex, in place, the resources modified before this"
+             " date (ISO 8601)")
+    parser.add_option('--batch-size', type='int', default=500,
+        help="with the options above, save the catalog every BATCH_SIZE"
+             " resources (default 500)")
 
     options, args = parser.parse_args()
     if len(args) != 1:
@@ -17,17 +17,58 @@
 # Import from the Standard Library
 from unittest import TestCase, main
 from datetime import time
+from os.path import exists
+from shutil import rmtree
+from tempfile import SpooledTemporaryFile, mkdtemp
 
 # Import from itools
 from itools.database import AndQuery, PhraseQuery
+from itools.web import get_context
+
+# Import from gevent
+from gevent import spawn, joinall
+from greenlet import settrace
 
 # Import from ikaaro
-from ikaaro.database import Database
+import ikaaro.database
+from ikaaro.config_access import rules_queries
+from ikaaro.config_menu import menu_trees
+from ikaaro.database import Database, DatabaseLock, get_context_value
+from ikaaro.database import read_commit_stamp, register_commit_cache
+from ikaaro.fields import Char_Field
 from ikaaro.folder import Folder
-from ikaaro.utils import get_base_path_query
+from ikaaro.root import user_titles
+from ikaaro.skins import Skin, skin_fragments
+from ikaaro.utils import get_base_path_query, get_keyset_page
+from ikaaro.utils import get_reindex_query, make_sortkey
+from ikaaro.views.folder_views import Folder_BrowseContent, get_allowed_names
 from ikaaro.text import Text
 
 
+class TestQueue(list):
+
+    def push(self, abspath):
+        self.append(abspath)
+
+
+
+class TestDepends_Folder(Folder):
+    """Reindexed when one of the resources in 'depends' changes."""
+
+    class_id = 'test-depends'
+    depends = Char_Field(multiple=True)
+    indexed_paths = []
+
+    def get_catalog_values(self):
+        self.indexed_paths.append(str(self.abspath))
+        return super(TestDepends_Folder, self).get_catalog_values()
+
+
+    def get_onchange_reindex(self):
+        return self.get_value('depends') or None
+
+
+
 class FreeTestCase(TestCase):
 
 
@@ -322,5 +363,595 @@ class FreeTestCase(TestCase):
                       ]))
 
 
+    def test_read_only_contexts(self):
+        with Database('demo.hforge.org', 19500, 20500) as database:
+            with database.init_context(read_only=True) as context:
+                root = context.root
+                root.make_resource('folder-read-only', Folder)
+            # Changes done in a read-only context are aborted
+            with database.init_context():
+                root = database.get_resource('/')
+                resource = root.get_resource('folder-read-only', soft=True)
+                self.assertEqual(resource, None)
+
+
+    def test_group_commit(self):
+        with Database('demo.hforge.org', 19500, 20500) as database:
+            database.group_commit_window = 60
+            with database.init_context() as context:
+                root = database.get_resource('/')
+                root.make_resource('folder-group-commit', Folder)
+                database.save_changes()
+                # The catalog flush is pending
+                flush = context.catalog_flush
+                self.assertNotEqual(flush, None)
+                self.assertEqual(flush.ready(), False)
+                # Aborting the next transaction flushes the catalog first
+                root.make_resource('folder-group-commit-aborted', Folder)
+                database.abort_changes()
+                self.assertEqual(flush.ready(), True)
+                search = database.search(abspath='/folder-group-commit')
+                self.assertEqual(len(search), 1)
+                resource = root.get_resource('folder-group-commit-aborted',
+                                             soft=True)
+                self.assertEqual(resource, None)
+
+
+    def test_group_commit_pending(self):
+        with Database('demo.hforge.org', 19500, 20500) as database:
+            path = database.get_pending_flush_path()
+            database.group_commit_window = 60
+            with database.init_context():
+                root = database.get_resource('/')
+                root.make_resource('folder-group-commit-lost', Folder)
+            # The paths to flush are on the disk
+            with open(path) as f:
+                self.assertIn('/folder-group-commit-lost\n', f.readlines())
+            # The process stops before the flush
+            database.catalog_flush = None
+            database.pending_docs = {}
+            database.group_commit_window = 0
+            # Reindexed at startup
+            with database.init_context(commit_at_exit=False):
+                search = database.search(abspath='/folder-group-commit-lost')
+                self.assertEqual(len(search), 0)
+                self.assertNotEqual(database.reindex_pending_flush(), 0)
+                search = database.search(abspath='/folder-group-commit-lost')
+                self.assertEqual(len(search), 1)
+            self.assertEqual(exists(path), False)
+
+
+    def test_database_lock(self):
+        lock = DatabaseLock()
+        events = []
+        def reader(name):
+            lock.acquire(read_only=True)
+            events.append(('enter', name))
+            # Let the other greenlets run
+            joinall([spawn(lambda: None)])
+            events.append(('exit', name))
+            lock.release(read_only=True)
+        def writer():
+            lock.acquire()
+            events.append(('enter', 'writer'))
+            lock.release()
+        joinall([spawn(reader, 'r1'), spawn(reader, 'r2'), spawn(writer)])
+        # Readers run concurrently, the writer waits for them
+        self.assertEqual(events[:2], [('enter', 'r1'), ('enter', 'r2')])
+        self.assertEqual(events[-1], ('enter', 'writer'))
+
+
+    def test_identity_map(self):
+        with Database('demo.hforge.org', 19500, 20500) as database:
+            with database.init_context():
+                root = database.get_resource('/')
+                root.make_resource('folder-identity', Folder)
+            with database.init_context():
+                a = database.get_resource('/folder-identity')
+                b = database.get_resource('/folder-identity')
+                self.assertIs(a, b)
+                self.assertEqual(a.get_value('title', language='en'), u'')
+                # Changes are seen at once
+                a.set_value('title', u'Title', language='en')
+                self.assertEqual(a.get_value('title', language='en'),
+                                 u'Title')
+                # No sharing while the transaction has changes
+                c = database.get_resource('/folder-identity')
+                self.assertIsNot(a, c)
+                database.abort_changes()
+                self.assertEqual(a.get_value('title', language='en'), u'')
+
+
+    def test_concurrent_contexts(self):
+        events = []
+        def trace(event, args):
+            events.append(event)
+        installed = ikaaro.database.trace_installed
+        previous = ikaaro.database.previous_trace
+        ikaaro.database.trace_installed = False
+        old_trace = settrace(trace)
+        try:
+            with Database('demo.hforge.org', 19500, 20500) as database:
+                contexts = []
+                def reader():
+                    with database.init_context(read_only=True) as context:
+                        joinall([spawn(lambda: None)])
+                        # Every reader gets its own context back
+                        contexts.append(get_context() is context)
+                joinall([spawn(reader), spawn(reader)])
+                self.assertEqual(contexts, [True, True])
+            # The trace installed before is still called
+            self.assertIn('switch', events)
+        finally:
+            settrace(old_trace)
+            ikaaro.database.trace_installed = installed
+            ikaaro.database.previous_trace = previous
+
+
+    def test_identity_map_size(self):
+        with Database('demo.hforge.org', 19500, 20500) as database:
+            with database.init_context():
+                root = database.get_resource('/')
+                root.make_resource('folder-identity-size', Folder)
+                for i in range(10):
+                    root.make_resource('folder-identity-size/%s' % i, Folder)
+            size = ikaaro.database.identity_map_size
+            ikaaro.database.identity_map_size = 5
+            try:
+                with database.init_context() as context:
+                    folder = database.get_resource('/folder-identity-size')
+                    names = [ x.name for x in folder.traverse_resources() ]
+                    self.assertEqual(len(names), 11)
+                    # Only the last resources used are kept
+                    resources = context.caches['resources']
+                    self.assertEqual(len(resources), 5)
+                    self.assertIn('/folder-identity-size/9', resources)
+            finally:
+                ikaaro.database.identity_map_size = size
+
+
+    def test_context_value(self):
+        calls = []
+        def get_value(key):
+            calls.append(key)
+            return key.upper()
+        with Database('demo.hforge.org', 19500, 20500) as database:
+            with database.init_context():
+                for i in range(3):
+                    value = get_context_value(database, 'test', 'a',
+                                              get_value)
+                    self.assertEqual(value, 'A')
+                self.assertEqual(calls, ['a'])
+            # Not shared by the next request
+            with database.init_context():
+                get_context_value(database, 'test', 'a', get_value)
+                self.assertEqual(calls, ['a', 'a'])
+
+
+    def test_commit_caches(self):
+        cache = {'key': 'value'}
+        register_commit_cache(cache, '/config/access')
+        with Database('demo.hforge.org', 19500, 20500) as database:
+            with database.init_context():
+                root = database.get_resource('/')
+                root.make_resource('folder-commit-cache', Folder)
+            self.assertEqual(cache, {'key': 'value'})
+            with database.init_context():
+                root = database.get_resource('/')
+                access = root.get_resource('config/access')
+                access.set_value('title', u'Access', language='en')
+            self.assertEqual(cache, {})
+
+
+    def test_rules_queries(self):
+        with Database('demo.hforge.org', 19500, 20500) as database:
+            for path in ['config/access', 'config/groups']:
+                with database.init_context():
+                    access = database.get_resource('/config/access')
+                    query = access.get_search_query(None, 'view')
+                    self.assertNotEqual(rules_queries, {})
+                    self.assertIs(access.get_search_query(None, 'view'),
+                                  query)
+                # Still cached while other resources are changed
+                with database.init_context():
+                    root = database.get_resource('/')
+                    root.make_resource('folder-rules-%s' % path[7:], Folder)
+                self.assertNotEqual(rules_queries, {})
+                # Cleared when the rules or the groups change
+                with database.init_context():
+                    resource = database.get_resource('/%s' % path)
+                    resource.set_value('title', u'Changed', language='en')
+                self.assertEqual(rules_queries, {})
+
+
+    def test_user_search(self):
+        with Database('demo.hforge.org', 19500, 20500) as database:
+            with database.init_context():
+                root = database.get_resource('/')
+                user = root.make_user('test-user-search@hforge.org',
+                                      'password')
+                userid = str(user.abspath)
+            with database.init_context() as context:
+                # Not built until the first search
+                self.assertNotIn('_context_user_search', context.__dict__)
+                context.search(PhraseQuery('format', 'user'))
+                self.assertIn('_context_user_search', context.__dict__)
+                # Built again for the new user
+                context.login(database.get_resource(userid))
+                self.assertNotIn('_context_user_search', context.__dict__)
+                context.search(PhraseQuery('format', 'user'))
+                self.assertIn('_context_user_search', context.__dict__)
+                context.logout()
+                self.assertNotIn('_context_user_search', context.__dict__)
+
+
+    def test_skin_fragments(self):
+        calls = []
+        def get_value(context):
+            calls.append(context.user)
+            return u'fragment'
+        skin = Skin('/ui/test-fragments')
+        with Database('demo.hforge.org', 19500, 20500) as database:
+            with database.init_context() as context:
+                for i in range(2):
+                    value = skin.get_fragment(context, 'footer', get_value)
+                    self.assertEqual(value, u'fragment')
+                self.assertEqual(len(calls), 1)
+            # Still cached while the users are changed
+            with database.init_context() as context:
+                root = database.get_resource('/')
+                root.make_user('test-skin-fragments@hforge.org', 'password')
+            with database.init_context() as context:
+                skin.get_fragment(context, 'footer', get_value)
+                self.assertEqual(len(calls), 1)
+            # Cleared when the configuration changes
+            with database.init_context():
+                access = database.get_resource('/config/access')
+                access.set_value('title', u'Fragments', language='en')
+            with database.init_context() as context:
+                skin.get_fragment(context, 'footer', get_value)
+                self.assertEqual(len(calls), 2)
+                # Only the last fragments used are kept
+                size = skin_fragments.size
+                skin_fragments.size = 2
+                try:
+                    for name in ['a', 'b', 'c']:
+                        skin.get_fragment(context, name, get_value)
+                    self.assertEqual(len(skin_fragments), 2)
+                finally:
+                    skin_fragments.size = size
+
+
+    def test_menu_trees(self):
+        with Database('demo.hforge.org', 19500, 20500) as database:
+            for path in ['/users', '/config/groups']:
+                with database.init_context() as context:
+                    menu = database.get_resource('/config/menu')
+                    tree = menu.get_menu_tree(context)
+                    self.assertIs(menu.get_menu_tree(context), tree)
+                    self.assertNotEqual(menu_trees, {})
+                # Cleared by every commit, the access to the targets may
+                # change
+                with database.init_context():
+                    resource = database.get_resource(path)
+                    resource.set_value('title', u'Menu', language='en')
+                self.assertEqual(menu_trees, {})
+
+
+    def test_user_titles(self):
+        with Database('demo.hforge.org', 19500, 20500) as database:
+            with database.init_context():
+                root = database.get_resource('/')
+                user = root.make_user('test-user-titles@hforge.org', 'password')
+                userid = str(user.abspath)
+            with database.init_context():
+                root = database.get_resource('/')
+                hits = user_titles.hits
+                title = root.get_user_title(userid)
+                self.assertEqual(title, u'test-user-titles@hforge.org')
+                self.assertEqual(root.get_user_title(userid), title)
+                self.assertEqual(user_titles.hits, hits + 1)
+                # Cleared when the user is changed
+                user = root.get_resource(userid)
+                user.set_value('firstname', u'Firstname')
+            with database.init_context():
+                root = database.get_resource('/')
+                self.assertEqual(root.get_user_title(userid), u'Firstname')
+                # Still cached while other resources are changed
+                root.make_resource('folder-user-titles', Folder)
+                hits = user_titles.hits
+                self.assertEqual(root.get_user_title(userid), u'Firstname')
+                self.assertEqual(user_titles.hits, hits + 1)
+
+
+    def test_last_author_rename(self):
+        with Database('demo.hforge.org', 19500, 20500) as database:
+            with database.init_context() as context:
+                root = database.get_resource('/')
+                user = root.make_user('test-last-author@hforge.org',
+                                      'password')
+                userid = str(user.abspath)
+                context.login(user)
+                root.make_resource('folder-last-author', Folder)
+            with database.init_context():
+                root = database.get_resource('/')
+                user = root.get_resource(userid)
+                user.set_value('firstname', u'Renamed')
+            with database.init_context():
+                search = database.search(abspath='/folder-last-author')
+                brain = search.get_documents()[0]
+                key = make_sortkey(u'Renamed', '/folder-last-author')
+                self.assertEqual(brain.last_author_title_sortkey, key)
+
+
+    def test_onchange_reindex(self):
+        with Database('demo.hforge.org', 19500, 20500) as database:
+            with database.init_context():
+                root = database.get_resource('/')
+                root.make_resource('folder-onchange', Folder)
+                # b depends on a, c on b, d on a and c
+                depends = {'a': [], 'b': ['a'], 'c': ['b'], 'd': ['a', 'c']}
+                for name in sorted(depends):
+                    resource = root.make_resource('folder-onchange/%s' % name,
+                                                  TestDepends_Folder)
+                    paths = [ '/folder-onchange/%s' % x
+                              for x in depends[name] ]
+                    resource.set_value('depends', paths)
+            del TestDepends_Folder.indexed_paths[:]
+            with database.init_context():
+                resource = database.get_resource('/folder-onchange/a')
+                resource.set_value('title', u'A', language='en')
+            # The dependencies of the dependencies, every one reindexed once
+            self.assertEqual(sorted(TestDepends_Folder.indexed_paths),
+                             ['/folder-onchange/a', '/folder-onchange/b',
+                              '/folder-onchange/c', '/folder-onchange/d'])
+
+
+    def test_sort_key_override(self):
+        class Browse(Folder_BrowseContent):
+            def get_key_sorted_by_last_author(self):
+                return lambda item: item.name
+        # The catalog sort key, unless the subclass sorts its own way
+        view = Folder_BrowseContent()
+        self.assertEqual(view.get_sort_key(None, None, 'last_author'),
+                         'last_author_title_sortkey')
+        view = Browse()
+        self.assertEqual(view.get_sort_key(None, None, 'last_author'), None)
+
+
+    def test_reindex_resources(self):
+        with Database('demo.hforge.org', 19500, 20500) as database:
+            with database.init_context():
+                root = database.get_resource('/')
+                root.make_resource('folder-reindex', Folder)
+                root.make_resource('folder-reindex/text', Text)
+            with database.init_context():
+                query = get_reindex_query(class_id='text',
+                                          base_abspath='/folder-reindex')
+                self.assertEqual(database.reindex_resources(query), 1)
+                query = get_reindex_query(base_abspath='/folder-reindex')
+                self.assertEqual(database.reindex_resources(query), 2)
+            # Not without the database lock
+            with database.init_context(read_only=True):
+                self.assertRaises(ValueError, database.reindex_resources,
+                                  query)
+
+
+    def test_reindex_resources_pending(self):
+        folder = mkdtemp()
+        with Database('demo.hforge.org', 19500, 20500) as database:
+            database.commit_stamp = '%s/commit.stamp' % folder
+            database.group_commit_window = 60
+            try:
+                with database.init_context():
+                    root = database.get_resource('/')
+                    root.make_resource('folder-reindex-pending', Folder)
+                self.assertNotEqual(database.catalog_flush, None)
+                count = read_commit_stamp(database.commit_stamp)
+                # The pending commits are flushed first
+                with database.init_context(commit_at_exit=False):
+                    query = get_reindex_query(
+                        base_abspath='/folder-reindex-pending')
+                    self.assertEqual(database.reindex_resources(query), 1)
+                    self.assertEqual(database.catalog_flush, None)
+                    self.assertEqual(database.pending_docs, {})
+                    search = database.search(
+                        abspath='/folder-reindex-pending')
+                    self.assertEqual(len(search), 1)
+                # The read-only workers are notified
+                self.assertTrue(read_commit_stamp(database.commit_stamp) >
+                                count)
+            finally:
+                database.group_commit_window = 0
+                database.commit_stamp = None
+                rmtree(folder)
+
+
+    def test_filter_allowed(self):
+        with Database('demo.hforge.org', 19500, 20500) as database:
+            with database.init_context():
+                root = database.get_resource('/')
+                root.make_resource('folder-allowed', Folder)
+                for name in ['a', 'b', 'c']:
+                    root.make_resource('folder-allowed/%s' % name, Text)
+            # One search gives the same result as one check per resource
+            with database.init_context() as context:
+                folder = context.root.get_resource('folder-allowed')
+                resources = list(folder.get_resources()) + [None]
+                allowed = context.root.filter_allowed(None, 'view', resources)
+                allowed = [ str(x.abspath) for x in allowed ]
+            with database.init_context() as context:
+                root = context.root
+                expected = [ str(x.abspath) for x in resources[:-1]
+                             if root.has_permission(None, 'view', x) ]
+                self.assertEqual(allowed, expected)
+
+
+    def test_get_allowed_names(self):
+        with Database('demo.hforge.org', 19500, 20500) as database:
+            with database.init_context():
+                root = database.get_resource('/')
+                root.make_resource('folder-allowed-names', Folder)
+                for name in ['a', 'b', 'c']:
+                    root.make_resource('folder-allowed-names/%s' % name, Text)
+            with database.init_context() as context:
+                root = context.root
+                folder = root.get_resource('folder-allowed-names')
+                names = ['a', 'b', 'c', 'missing']
+                # Anonymous users cannot change anything
+                allowed = get_allowed_names(folder, context, names, 'copy')
+                self.assertEqual(allowed, [])
+                # The overridden methods 'is_allowed_to_<action>' are used
+                root.is_allowed_to_remove = lambda user, x: x.name != 'b'
+                try:
+                    allowed = get_allowed_names(folder, context, names,
+                                                'remove')
+                    self.assertEqual(allowed, ['a', 'c'])
+                finally:
+                    del root.is_allowed_to_remove
+
+
+    def test_filter_allowed_override(self):
+        with Database('demo.hforge.org', 19500, 20500) as database:
+            with database.init_context():
+                root = database.get_resource('/')
+                root.make_resource('folder-allowed-override', Folder)
+                for name in ['a', 'b', 'c']:
+                    root.make_resource('folder-allowed-override/%s' % name,
+                                       Text)
+            with database.init_context() as context:
+                root = context.root
+                folder = root.get_resource('folder-allowed-override')
+                resources = list(folder.get_resources())
+                # A site with its own policy (overrides 'has_permission')
+                def has_permission(user, permission, resource, class_id=None):
+                    return resource.name != 'b'
+                root.has_permission = has_permission
+                try:
+                    allowed = root.filter_allowed(None, 'view', resources)
+                    self.assertEqual(sorted([ x.name for x in allowed ]),
+                                     ['a', 'c'])
+                    allowed = root.filter_allowed_to(None, 'remove',
+                                                     resources)
+                    self.assertEqual(sorted([ x.name for x in allowed ]),
+                                     ['a', 'c'])
+                    names = ['a', 'b', 'c']
+                    allowed = get_allowed_names(folder, context, names, 'copy')
+                    self.assertEqual(allowed, ['a', 'c'])
+                finally:
+                    del root.has_permission
+
+
+    def test_keyset_page(self):
+        with Database('demo.hforge.org', 19500, 20500) as database:
+            with database.init_context():
+                root = database.get_resource('/')
+                root.make_resource('folder-keyset', Folder)
+                for name in ['a', 'b', 'c', 'd', 'e']:
+                    root.make_resource('folder-keyset/%s' % name, Text)
+            with database.init_context():
+                query = get_base_path_query('/folder-keyset')
+                results = database.search(query)
+                # Forward
+                documents, previous, next = get_keyset_page(results,
+                    'abspath', size=2)
+                self.assertEqual([ x.name for x in documents ], ['a', 'b'])
+                self.assertEqual(previous, None)
+                documents, previous, next = get_keyset_page(results,
+                    'abspath', size=2, cursor=next)
+                self.assertEqual([ x.name for x in documents ], ['c', 'd'])
+                documents, previous2, next = get_keyset_page(results,
+                    'abspath', size=2, cursor=next)
+                self.assertEqual([ x.name for x in documents ], ['e'])
+                self.assertEqual(next, None)
+                # Backwards
+                documents, previous, next = get_keyset_page(results,
+                    'abspath', size=2, cursor=previous)
+                self.assertEqual([ x.name for x in documents ], ['a', 'b'])
+                self.assertEqual(previous, None)
+
+
+    def test_file_upload(self):
+        with Database('demo.hforge.org', 19500, 20500) as database:
+            with database.init_context():
+                root = database.get_resource('/')
+                # The body of a file input (see 'parse_multipart')
+                body = SpooledTemporaryFile()
+                body.write('hello world')
+                resource = root._make_file('file-upload', 'hello.txt',
+                                           'text/plain', body, 'en')
+                handler = resource.get_value('data')
+                self.assertEqual(handler.to_str(), 'hello world')
+
+
+    def test_push_after_commit(self):
+        queue = TestQueue()
+        with Database('demo.hforge.org', 19500, 20500) as database:
+            # Aborted: nothing is pushed
+            with database.init_context():
+                root = database.get_resource('/')
+                root.make_resource('folder-queue-abort', Folder)
+                database.push_after_commit(queue, '/folder-queue-abort')
+                database.abort_changes()
+            self.assertEqual(queue, [])
+            # Committed
+            with database.init_context():
+                root = database.get_resource('/')
+                root.make_resource('folder-queue', Folder)
+                database.push_after_commit(queue, '/folder-queue')
+                self.assertEqual(queue, [])
+            self.assertEqual(queue, ['/folder-queue'])
+
+
+    def test_browse_keyset(self):
+        with Database('demo.hforge.org', 19500, 20500) as database:
+            with database.init_context():
+                root = database.get_resource('/')
+                folder = root.make_resource('folder-browse-keyset', Folder)
+                for name in ['a', 'b', 'c', 'd', 'e']:
+                    root.make_resource('folder-browse-keyset/%s' % name, Text)
+            with database.init_context() as context:
+                folder = database.get_resource('/folder-browse-keyset')
+                query = get_base_path_query('/folder-browse-keyset')
+                view = Folder_BrowseContent()
+                # The default sort (by mtime, same mtime: by abspath)
+                context.query = {'batch_start': 0, 'batch_size': 2,
+                                 'batch_cursor': None, 'sort_by': 'mtime',
+                                 'reverse': True}
+                results = database.search(query)
+                self.assertEqual(view.get_items_total(folder, context,
+                                                      results), 5)
+                items = view.sort_and_batch(folder, context, results)
+                self.assertEqual([ x.name for x in items ], ['e', 'd'])
+                self.assertEqual(context.batch_cursors['previous'], None)
+                # Page 2
+                context.query['batch_cursor'] = context.batch_cursors['next']
+                items = view.sort_and_batch(folder, context, results)
+                self.assertEqual([ x.name for x in items ], ['c', 'b'])
+                # No sort (by abspath)
+                context.query = {'batch_start': 0, 'batch_size': 2,
+                                 'batch_cursor': None, 'sort_by': None,
+                                 'reverse': False}
+                items = view.sort_and_batch(folder, context, results)
+                self.assertEqual([ x.name for x in items ], ['a', 'b'])
+                context.query['batch_cursor'] = context.batch_cursors['next']
+                items = view.sort_and_batch(folder, context, results)
+                self.assertEqual([ x.name for x in items ], ['c', 'd'])
+                self.assertEqual(view.is_batch_estimate(folder, context), True)
+                # No key computed by the catalog, by 'batch_start' and the
+                # total is not estimated
+                context.query = {'batch_start': 2, 'batch_size': 2,
+                                 'batch_cursor': None, 'sort_by': 'name',
+                                 'reverse': False}
+                self.assertEqual(view.is_keyset_batch(folder, context), False)
+                self.assertEqual(view.is_batch_estimate(folder, context),
+                                 False)
+                self.assertEqual(view.get_items_total(folder, context,
+                                                      results), 5)
+                items = view.sort_and_batch(folder, context, results)
+                self.assertEqual([ x.name for x in items ], ['c', 'd'])
+
+
+
 if __name__ == '__main__':
     main()
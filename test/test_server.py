@@ -15,16 +15,39 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 # Import from the Standard Library
+from os import mkdir, utime
+from os.path import exists
+from shutil import rmtree
+from signal import SIGTERM
 from StringIO import StringIO
+from tempfile import mkdtemp
+from time import sleep
 from unittest import TestCase, main
+from zipfile import ZipFile
+
+# Import from gevent
+from gevent.pywsgi import WSGIServer
 
 # Import from itools
-from itools.database import PhraseQuery
+from itools.database import AllQuery, PhraseQuery, get_register_fields
 from itools.datatypes import String, Unicode
+from itools.uri import Path
 from itools.web.views import ItoolsView, BaseView
 
 # Import from ikaaro
+from ikaaro.folder import Folder
+from ikaaro.fulltext import TextCache, TextDeferred, TextQueue
 from ikaaro.server import Server
+from ikaaro.skins import get_skin_folder_index, skin_indexes
+from ikaaro.text import Text
+from ikaaro.thumbnails import ThumbnailCache, get_image_format
+from ikaaro.web.files import get_file_etag, parse_range
+from ikaaro.web.multipart import is_file_body, parse_multipart
+from ikaaro.web.multipart import read_file_body
+from ikaaro.web.prefork import Arbiter, forward_writes, make_listener
+from ikaaro.web.prefork import trust_forwarded
+from ikaaro.web.wsgi import is_read_only_view
+from ikaaro.web.zipstream import ZipStream, ZIP_STORED
 
 
 class TestHTML_View(ItoolsView):
@@ -79,6 +102,64 @@ class TestJsonAction_View(BaseView):
 
 
 
+class TestWrite_View(ItoolsView):
+
+    access = True
+    known_methods = ['GET']
+
+    def GET(self, resource, context):
+        context.root.set_value('title', u'Written', language='fr')
+        context.set_content_type('text/plain')
+        return 'written'
+
+
+
+class TestWriteFlag_View(TestWrite_View):
+
+    read_only = False
+
+
+
+class TestText_Handler(object):
+
+    def __init__(self, data):
+        self.data = data
+
+
+    def to_str(self):
+        return self.data
+
+
+    def to_text(self):
+        return self.data.decode('utf-8')
+
+
+
+class TestWorker_Server(object):
+
+    def run_worker(self, listener, is_writer):
+        sleep(60)
+
+
+
+def get_catalog_documents(target):
+    """Returns the stored values of the documents of the catalog of the
+    given instance, by abspath.
+    """
+    from itools.database.backends.catalog import Catalog
+    fields = get_register_fields()
+    stored = [ name for name, datatype in fields.items()
+               if getattr(datatype, 'stored', False) ]
+    catalog = Catalog('%s/catalog' % target, fields, read_only=True)
+    documents = {}
+    for brain in catalog.search(AllQuery()).get_documents():
+        documents[brain.abspath] = dict([ (x, getattr(brain, x, None))
+                                          for x in stored ])
+    catalog.close()
+    return documents
+
+
+
 class ServerTestCase(TestCase):
 
 
@@ -196,6 +277,77 @@ class ServerTestCase(TestCase):
                 self.assertEqual(server.root.get_value('title', language='fr'), u'Zidane')
 
 
+    def test_read_only_commit(self):
+        with Server('demo.hforge.org') as server:
+            with server.database.init_context(read_only=True):
+                server.dispatcher.add('/test/write', TestWrite_View)
+                retour = server.do_request('GET', '/test/write')
+                self.assertEqual(retour['status'], 200)
+            with server.database.init_context() as context:
+                title = context.root.get_value('title', language='fr')
+                self.assertNotEqual(title, u'Written')
+
+
+    def test_read_only_view(self):
+        with Server('demo.hforge.org') as server:
+            with server.database.init_context(read_only=True) as context:
+                server.dispatcher.add('/test/text', TestPlainText_View)
+                server.dispatcher.add('/test/write-flag', TestWriteFlag_View)
+                context.path = Path('/test/text')
+                self.assertEqual(is_read_only_view(context), True)
+                # The view says it writes, even with GET
+                context.path = Path('/test/write-flag')
+                self.assertEqual(is_read_only_view(context), False)
+
+
+    def test_reindex_catalog_parallel(self):
+        with Server('demo.hforge.org') as server:
+            with server.database.init_context():
+                root = server.root
+                root.make_resource('folder-reindex-parallel', Folder)
+                for name in ['a', 'b', 'c']:
+                    root.make_resource('folder-reindex-parallel/%s' % name,
+                                       Text)
+            self.assertEqual(server.reindex_catalog(quiet=True), True)
+            serial = get_catalog_documents(server.target)
+            self.assertIn('/folder-reindex-parallel/c', serial)
+            # The same documents with the same values
+            self.assertEqual(server.reindex_catalog(quiet=True, jobs=2), True)
+            self.assertEqual(get_catalog_documents(server.target), serial)
+
+
+    def test_reindex_catalog_resume(self):
+        with Server('demo.hforge.org') as server:
+            with server.database.init_context():
+                root = server.root
+                root.make_resource('folder-reindex-resume', Folder)
+                for name in ['a', 'b', 'c', 'd', 'e']:
+                    root.make_resource('folder-reindex-resume/%s' % name,
+                                       Text)
+            self.assertEqual(server.reindex_catalog(quiet=True), True)
+            documents = get_catalog_documents(server.target)
+            # Interrupted after 5 documents, the checkpoint is at the 4th
+            class Interrupted(Exception):
+                pass
+            log_progress = server.log_reindex_progress
+            def interrupt(doc_n, abspath, t0):
+                if doc_n == 5:
+                    raise Interrupted
+            server.log_reindex_progress = interrupt
+            server.reindex_checkpoint_interval = 2
+            self.assertRaises(Interrupted, server.reindex_catalog)
+            checkpoint = server.load_reindex_checkpoint()
+            self.assertEqual(checkpoint['doc_n'], 4)
+            # Resumed (by the workers), the checkpoint is removed at the end
+            server.log_reindex_progress = log_progress
+            self.assertEqual(server.reindex_catalog(quiet=True, jobs=2,
+                                                    resume=True), True)
+            self.assertEqual(server.load_reindex_checkpoint(), None)
+            self.assertEqual(exists(server.get_reindex_checkpoint_path()),
+                             False)
+            self.assertEqual(get_catalog_documents(server.target), documents)
+
+
     def test_catalog_access(self):
         query = PhraseQuery('format', 'user')
         with Server('demo.hforge.org') as server:
@@ -226,6 +378,270 @@ class ServerTestCase(TestCase):
         #        self.assertEqual(retour['status'], 200)
 
 
+    def test_skin_folder_index(self):
+        path = mkdtemp()
+        try:
+            mkdir('%s/generic' % path)
+            open('%s/generic/browse.xml.fr' % path, 'w').close()
+            names, variants = get_skin_folder_index(path, '%s/generic' % path)
+            self.assertEqual(names, set(['browse.xml.fr']))
+            self.assertEqual(variants, {'browse.xml': ['fr']})
+            self.assertIn(path, skin_indexes)
+            # The skin is indexed once: the folders are not probed again
+            mkdir('%s/missing' % path)
+            missing = '%s/missing' % path
+            self.assertEqual(get_skin_folder_index(path, missing),
+                             (set(), {}))
+            self.assertNotIn(missing, skin_indexes[path])
+            # Unless refreshed (in development)
+            self.assertEqual(get_skin_folder_index(path, missing, True),
+                             (set(), {}))
+        finally:
+            skin_indexes.pop(path, None)
+            rmtree(path)
+
+
+    def test_parse_range(self):
+        self.assertEqual(parse_range('bytes=0-99', 1000), (0, 100))
+        self.assertEqual(parse_range('bytes=900-', 1000), (900, 100))
+        self.assertEqual(parse_range('bytes=-100', 1000), (900, 100))
+        self.assertEqual(parse_range('bytes=900-2000', 1000), (900, 100))
+        # Not supported: the whole file
+        self.assertEqual(parse_range('bytes=0-9,20-29', 1000), None)
+        self.assertEqual(parse_range('items=0-9', 1000), None)
+        # Not satisfiable
+        self.assertRaises(ValueError, parse_range, 'bytes=1000-', 1000)
+
+
+    def test_file_etag(self):
+        path = mkdtemp()
+        try:
+            filename = '%s/file.txt' % path
+            with open(filename, 'w') as f:
+                f.write('hello world')
+            etag = get_file_etag(filename)
+            self.assertTrue(etag.startswith('W/"'))
+            self.assertEqual(get_file_etag(filename), etag)
+            # A new version
+            utime(filename, (0, 0))
+            self.assertNotEqual(get_file_etag(filename), etag)
+        finally:
+            rmtree(path)
+
+
+    def test_parse_multipart(self):
+        data = ''.join([ chr(i % 256) for i in range(200000) ])
+        body = ('--XyZ\r\n'
+                'Content-Disposition: form-data; name="title"\r\n\r\n'
+                'hello\r\n--XyZ\r\n'
+                'Content-Disposition: form-data; name="data"; '
+                'filename="C:\\tmp\\file.bin"\r\n'
+                'Content-Type: application/octet-stream\r\n\r\n'
+                '%s\r\n--XyZ--\r\n') % data
+        form = parse_multipart(StringIO(body), 'XyZ', len(body))
+        self.assertEqual(form['title'], 'hello')
+        # The uploaded file is not read in memory
+        filename, mimetype, body = form['data']
+        self.assertEqual((filename, mimetype),
+                         ('file.bin', 'application/octet-stream'))
+        self.assertTrue(is_file_body(body))
+        self.assertEqual(read_file_body(body), data)
+        self.assertEqual(read_file_body(body), data)
+        self.assertEqual(read_file_body('hello'), 'hello')
+
+
+    def test_thumbnail_cache(self):
+        folder = mkdtemp()
+        try:
+            cache = ThumbnailCache(folder, 2500)
+            self.assertEqual(cache.get('a' * 40, 'png'), None)
+            path = cache.set('a' * 40, 'png', 'x' * 1000)
+            self.assertEqual(cache.get('a' * 40, 'png'), path)
+            self.assertEqual(open(path).read(), 'x' * 1000)
+            # Full: the least recently used thumbnails are removed
+            path = cache.set('b' * 40, 'png', 'x' * 1000)
+            utime(path, (0, 0))
+            cache.set('c' * 40, 'png', 'x' * 600)
+            self.assertEqual(cache.get('b' * 40, 'png'), None)
+            self.assertNotEqual(cache.get('a' * 40, 'png'), None)
+            self.assertEqual(cache.size, 1600)
+        finally:
+            rmtree(folder)
+
+
+    def test_image_format(self):
+        folder = mkdtemp()
+        try:
+            path = '%s/image' % folder
+            with open(path, 'w') as f:
+                f.write('\x89PNG\r\n\x1a\n' + 'x' * 100)
+            self.assertEqual(get_image_format(None, path), 'png')
+            with open(path, 'w') as f:
+                f.write('hello world')
+            self.assertEqual(get_image_format(None, path), None)
+        finally:
+            rmtree(folder)
+
+
+    def test_queue_postpone(self):
+        folder = mkdtemp()
+        try:
+            queue = TextQueue(folder)
+            queue.push('/a')
+            queue.push('/b')
+            utime(queue.get_entry_path('/a'), (0, 0))
+            utime(queue.get_entry_path('/b'), (1, 1))
+            self.assertEqual([ x for mtime, x in queue.get_entries() ],
+                             ['/a', '/b'])
+            # Failed: try again later
+            queue.postpone('/a')
+            self.assertEqual([ x for mtime, x in queue.get_entries() ],
+                             ['/b', '/a'])
+            queue.remove('/a')
+            self.assertEqual([ x for mtime, x in queue.get_entries() ],
+                             ['/b'])
+        finally:
+            rmtree(folder)
+
+
+    def test_text_cache(self):
+        folder = mkdtemp()
+        try:
+            cache = TextCache(folder, 2500)
+            a = TestText_Handler('a' * 1000)
+            self.assertRaises(TextDeferred, cache.get_text, a, False)
+            self.assertEqual(cache.get_text(a), u'a' * 1000)
+            self.assertEqual(cache.get_text(a, extract=False), u'a' * 1000)
+            self.assertEqual(cache.hits, 1)
+            # Full: the least recently used texts are removed
+            b = TestText_Handler('b' * 1000)
+            cache.get_text(b)
+            for atime, path, size in cache.get_entries():
+                if open(path).read() == 'b' * 1000:
+                    utime(path, (0, 0))
+            cache.get_text(TestText_Handler('c' * 600))
+            self.assertRaises(TextDeferred, cache.get_text, b, False)
+            self.assertEqual(cache.get_text(a, extract=False), u'a' * 1000)
+            self.assertEqual(cache.size, 1600)
+        finally:
+            rmtree(folder)
+
+
+    def test_zip_stream(self):
+        folder = mkdtemp()
+        try:
+            path = '%s/file.txt' % folder
+            with open(path, 'w') as f:
+                f.write('hello world\n' * 10000)
+            archive = ZipStream()
+            archive.add_file('a/file.txt', path)
+            archive.add_file('a/stored.txt', path, compress_type=ZIP_STORED)
+            archive.add_data('b.txt', 'hello')
+            archive = ZipFile(StringIO(''.join(archive)))
+            self.assertEqual(archive.testzip(), None)
+            self.assertEqual(archive.read('a/file.txt'),
+                             'hello world\n' * 10000)
+            self.assertEqual(archive.read('a/stored.txt'),
+                             'hello world\n' * 10000)
+            self.assertEqual(archive.read('b.txt'), 'hello')
+        finally:
+            rmtree(folder)
+
+
+    def test_forward_writes(self):
+        folder = mkdtemp()
+        writer_path = '%s/writer.sock' % folder
+        def writer(environ, start_response):
+            body = environ['wsgi.input'].read()
+            start_response('201 Created', [('Set-Cookie', 'a=1'),
+                                           ('Set-Cookie', 'b=2')])
+            return ['%s %s %s %s %s' % (
+                environ['REQUEST_METHOD'], environ['REMOTE_ADDR'],
+                environ['wsgi.url_scheme'], environ['HTTP_HOST'], body)]
+        def reader(environ, start_response):
+            start_response('200 OK', [])
+            return ['read']
+        server = WSGIServer(make_listener(writer_path),
+                            trust_forwarded(writer))
+        server.start()
+        try:
+            application = forward_writes(reader, writer_path,
+                                         max_upload_size=10)
+            def request(method, body, **kw):
+                response = []
+                def start_response(status, headers):
+                    response.append(status)
+                    response.append(headers)
+                environ = {'REQUEST_METHOD': method, 'PATH_INFO': '/a b',
+                           'QUERY_STRING': '', 'REMOTE_ADDR': '10.0.0.1',
+                           'wsgi.url_scheme': 'https',
+                           'HTTP_HOST': 'example.com',
+                           'CONTENT_LENGTH': str(len(body)),
+                           'wsgi.input': StringIO(body)}
+                environ.update(kw)
+                response.append(''.join(application(environ, start_response)))
+                return response
+            # Read-only requests are not forwarded
+            status, headers, body = request('GET', '')
+            self.assertEqual(body, 'read')
+            # The others are forwarded, with the client address and scheme
+            status, headers, body = request('POST', 'hello')
+            self.assertEqual(status, '201 Created')
+            self.assertEqual(body, 'POST 10.0.0.1 https example.com hello')
+            # The Set-Cookie headers are not merged
+            cookies = [ v for k, v in headers if k.lower() == 'set-cookie' ]
+            self.assertEqual(cookies, ['a=1', 'b=2'])
+            # The writer only trusts the address added by the worker
+            status, headers, body = request('POST', 'hello',
+                HTTP_X_FORWARDED_FOR='1.2.3.4')
+            self.assertEqual(body, 'POST 10.0.0.1 https example.com hello')
+            # Too large
+            status, headers, body = request('POST', 'x' * 11)
+            self.assertEqual(status, '413 Request Entity Too Large')
+            # Chunked bodies have no length, they are streamed
+            status, headers, body = request('POST', 'hello',
+                CONTENT_LENGTH='', HTTP_TRANSFER_ENCODING='chunked')
+            self.assertEqual(body, 'POST 10.0.0.1 https example.com hello')
+            status, headers, body = request('POST', 'x' * 11,
+                CONTENT_LENGTH='', HTTP_TRANSFER_ENCODING='chunked')
+            self.assertEqual(status, '413 Request Entity Too Large')
+        finally:
+            server.stop()
+            rmtree(folder)
+
+
+    def test_arbiter(self):
+        arbiter = Arbiter(TestWorker_Server(), '127.0.0.1', 0, 2)
+        for slot in range(2):
+            arbiter.spawn(slot)
+        pids = dict(arbiter.workers)
+        self.assertEqual(sorted(pids), [0, 1])
+        spawned = []
+        spawn = arbiter.spawn
+        def record(slot):
+            spawned.append(slot)
+            spawn(slot)
+        arbiter.spawn = record
+        try:
+            # Reload: the workers are restarted one by one, the writer last
+            arbiter.reloading = True
+            arbiter.reload()
+            self.assertEqual(spawned, [1, 0])
+            self.assertEqual(sorted(arbiter.workers), [0, 1])
+            for slot, pid in pids.items():
+                self.assertNotEqual(arbiter.workers[slot], pid)
+        finally:
+            # Stop
+            arbiter.stop_signal(SIGTERM, None)
+            self.assertTrue(arbiter.stopping)
+            while arbiter.workers:
+                pid = arbiter.wait()
+                slot = arbiter.get_slot(pid)
+                if slot is not None:
+                    del arbiter.workers[slot]
+        self.assertEqual(arbiter.get_slot(pids[0]), None)
+
+
 
 if __name__ == '__main__':
     main()